@@ -0,0 +1,65 @@
+"""Micro-benchmarks for the pure text helpers on the upload hot path.
+
+    python -m benchmarks.bench_format
+    python -m benchmarks.bench_format --baseline benchmarks/results/format-....json
+"""
+import argparse
+import json
+import sys
+import timeit
+
+from bot.handlers import split_message
+from services.cv_analyzer import escape_markdown, extract_job_positions, format_response
+from benchmarks.fakes import build_sample_response
+from benchmarks.results import compare_with_baseline, save_results
+
+
+def bench(func, number, repeat):
+    """Best-of-``repeat`` timing, reported as microseconds per call and calls per second."""
+    best = min(timeit.repeat(func, number=number, repeat=repeat)) / number
+    return {"us_per_call": best * 1_000_000, "ops_per_sec": 1 / best}
+
+
+def run(args):
+    response = build_sample_response(args.bullets)
+    formatted = format_response(response)
+    line = "• **Experience:** Designed 12 REST APIs (payments), cutting p99 latency by 35%!"
+
+    cases = {
+        "format_response": lambda: format_response(response),
+        "escape_markdown": lambda: escape_markdown(line),
+        "escape_markdown_full_text": lambda: escape_markdown(response),
+        "split_message": lambda: split_message(formatted),
+        "extract_job_positions": lambda: extract_job_positions(response),
+    }
+    results = {name: bench(func, args.number, args.repeat) for name, func in cases.items()}
+    results["params"] = {
+        "bullets": args.bullets,
+        "input_chars": {"response": len(response), "formatted": len(formatted)},
+    }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=200, help="calls per timing run")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--bullets", type=int, default=12, help="bullets per section in the sample response")
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    path = save_results("format", results, args.output)
+    print(f"Results saved to {path}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(args.baseline, results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Cold-start profile: how long importing the bot takes and which modules dominate.
+
+Each sample runs a fresh interpreter, so the numbers include nothing cached in
+this process. ``-X importtime`` gives the per-module breakdown; modules that are
+supposed to load lazily are checked to stay out of ``sys.modules``.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --baseline benchmarks/results/startup-....json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.results import compare_with_baseline, save_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed once an upload arrives; importing main must not pull them in
+DEFERRED_MODULES = ("google.generativeai", "PIL.Image")
+
+_PROBE = (
+    "import sys, time; start = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - start); print(','.join(m for m in {deferred!r} if m in sys.modules))"
+)
+
+
+def run_python(args):
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+
+
+def import_time(module):
+    """Wall-clock seconds to import ``module`` in a fresh interpreter, and any deferred modules it loaded."""
+    out = run_python(["-c", _PROBE.format(module=module, deferred=DEFERRED_MODULES)]).stdout.splitlines()
+    return float(out[0]), [name for name in out[1].split(",") if name]
+
+
+def import_profile(module):
+    """Parse ``-X importtime`` output into ``{module: (self_us, cumulative_us)}``."""
+    stderr = run_python(["-X", "importtime", "-c", f"import {module}"]).stderr
+    profile = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def run(args):
+    samples = []
+    loaded = []
+    for _ in range(args.repeat):
+        seconds, loaded = import_time(args.module)
+        samples.append(seconds)
+
+    profile = import_profile(args.module)
+    top_level = {}
+    for name, (self_us, _) in profile.items():
+        package = name.split(".")[0]
+        top_level[package] = top_level.get(package, 0) + self_us
+    heaviest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[: args.top]
+
+    return {
+        "params": {"module": args.module},
+        "import_ms": {
+            "median": statistics.median(samples) * 1000,
+            "min": min(samples) * 1000,
+        },
+        "modules_imported": len(profile),
+        "packages_ms": {package: us / 1000 for package, us in heaviest},
+        "deferred_modules_loaded": loaded,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module whose import is profiled")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters to time")
+    parser.add_argument("--top", type=int, default=15, help="heaviest top-level packages to report")
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    path = save_results("startup", results, args.output)
+    print(f"Results saved to {path}")
+
+    if results["deferred_modules_loaded"]:
+        print(f"Deferred modules imported eagerly: {', '.join(results['deferred_modules_loaded'])}")
+    if args.baseline:
+        regressions = compare_with_baseline(args.baseline, results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""End-to-end load test for the document upload pipeline.
+
+Synthetic webhook bodies go through the same steps as in ``run_single_process``:
+``json.loads`` of the request body, ``Update.de_json`` and
+``Application.process_update`` dispatching to ``handle_document``. The Bot API
+is answered by a local stub, Gemini by a fake analyzer, and the database is
+either in-memory or a real Postgres (``--db-url``). Every query is counted so
+regressions in DB round trips show up next to latency, throughput and memory.
+
+    python -m benchmarks.bench_upload --uploads 500 --concurrency 25
+    python -m benchmarks.bench_upload --db-url postgres://... --baseline benchmarks/results/upload-....json
+    python -m benchmarks.bench_upload --premium-every 10 --gemini-latency 0.05 --concurrency 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from telegram import Update
+
+import bot.handlers as handlers
+from benchmarks.fakes import (
+    BENCH_BOT_TOKEN,
+    CountingPool,
+    FakeAnalyzer,
+    FakePool,
+    FakeTelegramRequest,
+    encode_payloads,
+    is_premium_id,
+)
+from benchmarks.results import compare_with_baseline, save_results
+from logging_config import setup_logging
+from main import build_application
+from services.storage import StorageService
+
+SAMPLE_PDF = b"%PDF-1.4\n" + b"0" * 48_000 + b"\n%%EOF"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def make_storage(args):
+    storage = StorageService(args.db_url)
+    if args.db_url:
+        await storage.prepare_postgres_database()
+        storage.db_pool = CountingPool(await storage.get_db_pool())
+    else:
+        storage.db_pool = CountingPool(FakePool(latency=args.db_latency, premium_every=args.premium_every))
+    return storage
+
+
+def file_content(file_id):
+    # Distinct content per upload, otherwise the Gemini client coalesces them all
+    return SAMPLE_PDF + file_id.encode()
+
+
+async def run_uploads(args, application, payloads):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    lanes = {"premium": [], "free": []}
+
+    async def one(body):
+        async with semaphore:
+            start = time.perf_counter()
+            update = Update.de_json(json.loads(body), application.bot)
+            await application.process_update(update)
+            latency = time.perf_counter() - start
+            latencies.append(latency)
+            premium = is_premium_id(update.effective_user.id, args.premium_every)
+            lanes["premium" if premium else "free"].append(latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(body) for body in payloads))
+    return latencies, lanes, time.perf_counter() - start
+
+
+async def run(args):
+    handlers._cv_analyzer = FakeAnalyzer(latency=args.gemini_latency)
+    handlers._gemini_client = None
+    handlers._scheduler = None
+    storage = await make_storage(args)
+    request = FakeTelegramRequest(file_content, latency=args.telegram_latency)
+    application = build_application(storage, token=BENCH_BOT_TOKEN, request=request)
+    await application.initialize()
+    payloads = encode_payloads(args.uploads, args.users)
+
+    # Warm up imports, regex caches and the pool before measuring
+    await run_uploads(args, application, payloads[: min(10, len(payloads))])
+    counter = storage.db_pool.counter
+    counter.update(round_trips=0, acquires=0)
+    request.sent = 0
+
+    latencies, lanes, elapsed = await run_uploads(args, application, payloads)
+    sent = request.sent
+    round_trips = counter["round_trips"]
+    acquires = counter["acquires"]
+
+    # Memory is measured in a separate pass so tracemalloc doesn't skew timings
+    tracemalloc.start()
+    baseline_current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    await run_uploads(args, application, payloads)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await application.shutdown()
+
+    return {
+        "params": {
+            "uploads": args.uploads,
+            "concurrency": args.concurrency,
+            "users": args.users,
+            # Only whether a real database was used; the URL may hold credentials
+            "real_db": bool(args.db_url),
+            "db_latency": args.db_latency,
+            "gemini_latency": args.gemini_latency,
+            "telegram_latency": args.telegram_latency,
+            "premium_every": args.premium_every,
+        },
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p90": percentile(latencies, 90) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies) * 1000,
+            "mean": statistics.mean(latencies) * 1000,
+        },
+        # Premium p99 should stay near the bare Gemini latency however busy the free lane is
+        "lane_latency_ms": {
+            lane: {"p50": percentile(samples, 50) * 1000, "p99": percentile(samples, 99) * 1000}
+            for lane, samples in lanes.items() if samples
+        },
+        "throughput_per_sec": args.uploads / elapsed,
+        "db_round_trips_per_upload": round_trips / args.uploads,
+        "db_acquires_per_upload": acquires / args.uploads,
+        "messages_sent_per_upload": sent / args.uploads,
+        "memory_kb": {
+            "peak_per_inflight_upload": (peak - baseline_current) / 1024 / min(args.concurrency, args.uploads),
+            "retained_per_upload": max(0, current - baseline_current) / 1024 / args.uploads,
+        },
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50, help="distinct synthetic user ids")
+    parser.add_argument("--db-url", help="run against a real Postgres instead of the in-memory fake")
+    parser.add_argument("--db-latency", type=float, default=0.001, help="simulated seconds per fake DB query")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="simulated seconds per Gemini call")
+    parser.add_argument("--premium-every", type=int, default=0,
+                        help="make every Nth synthetic user premium (in-memory database only)")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="simulated seconds per Bot API call")
+    parser.add_argument("--output", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Keep the handlers' logging cost (at the configured LOG_* levels) in the measurement but not on the terminal
+    setup_logging(stream=open(os.devnull, "w"))
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    path = save_results("upload", results, args.output)
+    print(f"Results saved to {path}")
+
+    if args.baseline:
+        regressions = compare_with_baseline(args.baseline, results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""Stand-ins used by the benchmarks: synthetic Telegram updates, a local Bot API
+transport, a fake Gemini analyzer and a counting database pool that can wrap
+either a real asyncpg pool or an in-memory fake."""
+import asyncio
+import itertools
+import json
+import time
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+from telegram.request import BaseRequest
+
+from services.cv_analyzer import CVAnalyzer
+
+SAMPLE_SECTIONS = [
+    ("نقاط قوت رزومه:", "تجربه قابل توجه در توسعه نرم‌افزار (Python, Go) و مدیریت تیم‌های کوچک."),
+    ("زمینه‌های نیازمند بهبود:", "عدم ذکر نتایج کمی پروژه‌ها؛ مثلاً درصد بهبود کارایی یا کاهش هزینه."),
+    ("پیشنهادات برای بهبود رزومه:", "افزودن بخش خلاصه حرفه‌ای و لینک به پروژه‌های متن‌باز [GitHub]."),
+]
+
+SAMPLE_JOB_POSITIONS = [
+    "Backend Engineer",
+    "Software Engineer",
+    "Python Developer",
+    "DevOps Engineer",
+    "Technical Lead",
+]
+
+
+def build_sample_response(bullets_per_section=12):
+    """Build a Gemini-style analysis in the format requested by CVAnalyzer's prompt."""
+    lines = []
+    for title, bullet in SAMPLE_SECTIONS:
+        lines.append(title)
+        lines.append("")
+        for i in range(bullets_per_section):
+            lines.append(f"• **مورد {i + 1}:** {bullet}")
+        lines.append("")
+    lines.append("نمونه‌های بهبود یافته:")
+    lines.append("")
+    for i in range(3):
+        lines.append(f"• **Experience {i + 1}**:")
+        lines.append("")
+        lines.append("نسخه اصلی:")
+        lines.append("Worked on backend services (REST APIs) for the payments team.")
+        lines.append("نسخه بهبود یافته:")
+        lines.append("Designed and shipped 12 REST APIs for payments, cutting p99 latency by 35%.")
+        lines.append("")
+    lines.append("موقعیت‌های شغلی مرتبط:")
+    lines.append("")
+    for position in SAMPLE_JOB_POSITIONS:
+        lines.append(f"• {position}")
+    return "\n".join(lines)
+
+
+class FakeAnalyzer(CVAnalyzer):
+    """A CVAnalyzer whose Gemini call is replaced by a fixed latency and a canned response."""
+
+    def __init__(self, latency=0.0, response_text=None):
+        self.latency = latency
+        self.response_text = response_text or build_sample_response()
+        self.model = SimpleNamespace(model_name="models/gemini-1.5-flash")
+
+    def generate_analysis(self, pdf_content):
+        if self.latency:
+            # Runs in a worker thread, like the blocking SDK call it stands in for
+            time.sleep(self.latency)
+        return self.response_text
+
+
+# --- Database ---------------------------------------------------------------
+
+def is_premium_id(user_id, premium_every):
+    """Every ``premium_every``-th synthetic user is premium; 0 disables premium users."""
+    return bool(premium_every) and user_id % premium_every == 0
+
+
+class FakeConnection:
+    """Answers the queries issued by StorageService with canned rows."""
+
+    def __init__(self, latency, premium_every=0):
+        self.latency = latency
+        self.premium_every = premium_every
+        self._ids = itertools.count(1)
+
+    async def _round_trip(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def execute(self, query, *args):
+        await self._round_trip()
+        return "OK"
+
+    async def fetch(self, query, *args):
+        await self._round_trip()
+        return []
+
+    async def fetchrow(self, query, *args):
+        await self._round_trip()
+        row_id = next(self._ids)
+        row = {"id": row_id, "position_id": row_id, "user_id": args[0] if args else None}
+        if "INSERT INTO users" in query and is_premium_id(args[0], self.premium_every):
+            row.update(is_premium=True, payment_id=f"payment_{args[0]}_0")
+        return row
+
+    async def fetchval(self, query, *args):
+        await self._round_trip()
+        return next(self._ids)
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class FakePool:
+    def __init__(self, latency=0.0, premium_every=0):
+        self._conn = FakeConnection(latency, premium_every)
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self._conn
+
+    async def close(self):
+        pass
+
+
+class CountingConnection:
+    """Proxy around a connection that counts every query sent to the server."""
+
+    QUERY_METHODS = ("execute", "executemany", "fetch", "fetchrow", "fetchval")
+
+    def __init__(self, conn, counter):
+        self._conn = conn
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if name in self.QUERY_METHODS:
+            async def counted(*args, **kwargs):
+                self._counter["round_trips"] += 1
+                return await attr(*args, **kwargs)
+            return counted
+        return attr
+
+
+class CountingPool:
+    def __init__(self, pool):
+        self._pool = pool
+        self.counter = {"round_trips": 0, "acquires": 0}
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.counter["acquires"] += 1
+        async with self._pool.acquire() as conn:
+            yield CountingConnection(conn, self.counter)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+# --- Telegram ---------------------------------------------------------------
+
+BENCH_BOT_TOKEN = "123456:bench"
+BENCH_BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+def build_update_payload(update_id, user_id, mime_type="application/pdf"):
+    """A webhook body as Telegram would POST it for a document upload."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench_{user_id}"},
+            "document": {
+                "file_id": f"file-{update_id}",
+                "file_unique_id": f"unique-{update_id}",
+                "file_name": "resume.pdf",
+                "mime_type": mime_type,
+                "file_size": 48_000,
+            },
+        },
+    }
+
+
+def encode_payloads(count, users, mime_type="application/pdf"):
+    return [
+        json.dumps(build_update_payload(i, 100_000 + i % users, mime_type)).encode()
+        for i in range(count)
+    ]
+
+
+class FakeTelegramRequest(BaseRequest):
+    """Answers Bot API calls locally, after ``latency`` seconds, so updates run through the real
+    ``Update.de_json`` / ``Application.process_update`` path without reaching Telegram.
+
+    Files are served as ``file_content(file_id)``; ``sent`` counts sendMessage calls.
+    """
+
+    def __init__(self, file_content, latency=0.0):
+        self.file_content = file_content
+        self.latency = latency
+        self.sent = 0
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if "/file/bot" in url:
+            return 200, self.file_content(url.rsplit("/", 1)[-1])
+        params = request_data.parameters if request_data else {}
+        result = self._result(url.rsplit("/", 1)[-1], params)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    def _result(self, endpoint, params):
+        if endpoint == "getMe":
+            return BENCH_BOT_USER
+        if endpoint == "getChatMember":
+            return {"status": "member", "user": {"id": params["user_id"], "is_bot": False, "first_name": "Bench"}}
+        if endpoint == "getFile":
+            file_id = params["file_id"]
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": 48_000, "file_path": f"documents/{file_id}"}
+        if endpoint == "sendMessage":
+            self.sent += 1
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": params["chat_id"], "type": "private"},
+                "from": BENCH_BOT_USER,
+                "text": params.get("text", ""),
+            }
+        return True
@@ -0,0 +1,101 @@
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Metrics where a larger value is an improvement; everything else is "lower is better"
+HIGHER_IS_BETTER = ("throughput", "ops_per_sec")
+
+# Results key holding the run's parameters; they describe the run and are never compared as metrics
+PARAMS_KEY = "params"
+
+
+def save_results(name, results, path=None):
+    """Write a benchmark run to disk and return the file path."""
+    payload = {
+        "benchmark": name,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    return path
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if not prefix and key == PARAMS_KEY:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(baseline, current, threshold=0.10):
+    """Compare two result dicts.
+
+    Returns a list of (metric, baseline, current, change, regressed) tuples, where
+    ``change`` is the relative change and ``regressed`` is True when the metric got
+    worse by more than ``threshold``.
+    """
+    base_flat = _flatten(baseline)
+    cur_flat = _flatten(current)
+    rows = []
+    for metric in sorted(base_flat.keys() & cur_flat.keys()):
+        old, new = base_flat[metric], cur_flat[metric]
+        if old == 0:
+            continue
+        change = (new - old) / old
+        if any(token in metric for token in HIGHER_IS_BETTER):
+            regressed = change < -threshold
+        else:
+            regressed = change > threshold
+        rows.append((metric, old, new, change, regressed))
+    return rows
+
+
+def param_differences(baseline, current):
+    """(name, baseline value, current value) for every parameter that differs between two runs."""
+    old, new = baseline.get(PARAMS_KEY), current.get(PARAMS_KEY)
+    if old is None or new is None:
+        return []
+    return [(name, old.get(name), new.get(name)) for name in sorted(old.keys() | new.keys()) if old.get(name) != new.get(name)]
+
+
+def compare_with_baseline(path, results, threshold):
+    """Print a comparison with the results file at ``path`` and return the number of regressions.
+
+    Exits instead when the baseline was run with different parameters, since its numbers aren't comparable.
+    """
+    baseline = load_results(path)
+    differences = param_differences(baseline, results)
+    if differences:
+        changes = ", ".join(f"{name}: {old} -> {new}" for name, old, new in differences)
+        sys.exit(f"Not comparing with {path}, parameters differ ({changes})")
+    return print_comparison(compare_results(baseline, results, threshold))
+
+
+def print_comparison(rows):
+    regressions = 0
+    for metric, old, new, change, regressed in rows:
+        marker = "REGRESSION" if regressed else ""
+        print(f"{metric:<45} {old:>14.4f} {new:>14.4f} {change:>+8.1%} {marker}")
+        regressions += regressed
+    return regressions
@@ -2,57 +2,164 @@ import io
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, CallbackQueryHandler
-from config import GOOGLE_GENERATIVE_AI_KEY
-from services.cv_analyzer import CVAnalyzer
+from config import GOOGLE_GENERATIVE_AI_KEY, RENDER_CACHE_SIZE, HISTORY_CACHE_SIZE, ANALYSIS_RESERVED_PREMIUM, PREMIUM_CACHE_TTL, PREMIUM_CACHE_SIZE, CV_OWNER_CACHE_SIZE
+from services.cv_analyzer import CVAnalyzer, extract_job_positions, format_response
+from services.gemini_client import AdaptiveGeminiClient, AnalysisError, CircuitOpenError
 from services.storage import StorageService
+from services.payment import PaymentService
+from services.scheduler import AnalysisScheduler
+from services.rating_writer import RatingWriter
+from services.cache import LRUCache
+from services.metrics import STAGE_SECONDS, UPLOADS
 from io import BytesIO
-from PIL import Image
 from telegram.error import BadRequest, RetryAfter, TimedOut
 import asyncio
 import logging
+import re
+import time
+from datetime import datetime
+from logging_config import SAMPLED, redact
 
-logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
-cv_analyzer = CVAnalyzer(GOOGLE_GENERATIVE_AI_KEY)
+# Created on first upload so importing the handlers stays cheap
+_cv_analyzer = None
+
+def get_cv_analyzer() -> CVAnalyzer:
+    global _cv_analyzer
+    if _cv_analyzer is None:
+        _cv_analyzer = CVAnalyzer(GOOGLE_GENERATIVE_AI_KEY)
+    return _cv_analyzer
+
+_gemini_client = None
+
+def get_gemini_client() -> AdaptiveGeminiClient:
+    global _gemini_client
+    if _gemini_client is None:
+        _gemini_client = AdaptiveGeminiClient(get_cv_analyzer())
+    return _gemini_client
+
+_scheduler = None
+
+def get_scheduler() -> AnalysisScheduler:
+    global _scheduler
+    if _scheduler is None:
+        gemini_client = get_gemini_client()
+        # Admit as many analyses as the Gemini client currently allows, so queuing happens here, by priority
+        _scheduler = AnalysisScheduler(lambda: gemini_client.limiter.limit, ANALYSIS_RESERVED_PREMIUM)
+    return _scheduler
+
+payment_service = PaymentService()
+
+# payment id -> (verified, expires at); keeps the payment gateway off the upload path
+premium_status = LRUCache("premium_status", PREMIUM_CACHE_SIZE)
+
+async def is_premium_user(user_row) -> bool:
+    payment_id = user_row.get("payment_id")
+    if not user_row.get("is_premium") or not payment_id:
+        return False
+    cached = premium_status.get(payment_id)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    try:
+        verified = await asyncio.to_thread(payment_service.verify_payment, payment_id)
+    except Exception as e:
+        # An unreachable gateway shouldn't block uploads; serve from the free lane and check again later
+        logger.warning("Payment verification failed for %s: %s", payment_id, e)
+        return False
+    premium_status.put(payment_id, (verified, time.monotonic() + PREMIUM_CACHE_TTL))
+    return verified
+
+def image_to_pdf(content) -> BytesIO:
+    # Pillow is only needed for image uploads, so import it on first use
+    from PIL import Image
+
+    image = Image.open(BytesIO(content))
+    pdf_buffer = BytesIO()
+    image.save(pdf_buffer, 'PDF')
+    return BytesIO(pdf_buffer.getvalue())
 
 # Define MAX_MESSAGE_LENGTH constant
 MAX_MESSAGE_LENGTH = 4096
 
+# How many times an upload is re-queued while the Gemini circuit breaker is open
+MAX_REQUEUES = 2
+
+# cv id -> (owner user id, MarkdownV2 chunks ready to send), so re-sending an analysis skips formatting
+rendered_chunks = LRUCache("rendered_chunks", RENDER_CACHE_SIZE)
+
+HISTORY_PAGE_SIZE = 5
+
+# user id -> first /history page (plus one row to tell whether there is more)
+recent_cvs = LRUCache("recent_cvs", HISTORY_CACHE_SIZE)
+
+# cv id -> owner user id, so rating presses are checked without a query
+cv_owners = LRUCache("cv_owners", CV_OWNER_CACHE_SIZE)
+
+RATING_DATA = re.compile(r"^rate_(\d+)_([1-5])$")
+
+RATING_TEXT = {
+    5: "عالی",
+    4: "خوب",
+    3: "متوسط",
+    2: "بد",
+    1: "افتضاح"
+}
+
+_rating_writer = None
+
+def get_rating_writer(storage_service: StorageService) -> RatingWriter:
+    global _rating_writer
+    if _rating_writer is None:
+        _rating_writer = RatingWriter(storage_service)
+    return _rating_writer
+
+async def flush_ratings():
+    """Write out ratings still queued in memory; called on shutdown."""
+    if _rating_writer is not None:
+        await _rating_writer.close()
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService) -> None:
     user = update.effective_user
     try:
         saved_user = await storage_service.save_user(user.id, user.username)
-        logger.info(f"User saved: {saved_user}")
+        logger.info("User saved: %s", saved_user["user_id"])
         await update.message.reply_text(f"سلام {user.first_name}! من ربات تحلیلگر رزومه هستم. لطفاً رزومه خود را به صورت فایل PDF ارسال کنید تا آن را تحلیل کنم.")
     except Exception as e:
-        logger.error(f"Error saving user: {e}", exc_info=True)
+        logger.error("Error saving user: %s", e, exc_info=True)
         await update.message.reply_text("متأسفانه در حال حاضر مشکلی پیش آمده است. لطفاً بعداً دوباره تلاش کنید.")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text("برای تحلیل رزومه، لطفاً آن را به صورت فایل PDF ارسال کنید. من آن را بررسی کرده و نتایج تحلیل را برای شما ارسال خواهم کرد.")
+    await update.message.reply_text("برای تحلیل رزومه، لطفاً آن را به صورت فایل PDF ارسال کنید. من آن را بررسی کرده و نتایج تحلیل را برای شما ارسال خواهم کرد.\n\nبرای دیدن دوباره آخرین تحلیل خود از دستور /last و برای مرور تحلیل‌های قبلی از دستور /history استفاده کنید.")
 
 async def check_channel_membership(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     user_id = update.effective_user.id
     try:
         chat_member = await context.bot.get_chat_member(chat_id='@growly_ir', user_id=user_id)
         is_member = chat_member.status in ['member', 'administrator', 'creator']
-        logger.info(f"User {user_id} channel membership status: {is_member}")
+        logger.debug("User %s channel membership status: %s", user_id, is_member, extra=SAMPLED)
         return is_member
     except Exception as e:
-        logger.error(f"Error checking channel membership: {e}")
+        logger.error("Error checking channel membership: %s", e)
         return False  # Assume not a member if there's an error
 
-async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService) -> None:
-    logger.info("handle_document function called")
+async def requeue_document(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService, delay: float, requeued: int) -> None:
+    await asyncio.sleep(delay)
+    await handle_document(update, context, storage_service, requeued=requeued)
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService, requeued: int = 0) -> None:
     max_retries = 3
     for attempt in range(max_retries):
         try:
             user = update.effective_user
-            logger.info(f"Processing document for user: {user.id}")
-            await storage_service.save_user(user.id, user.username)
+            logger.info("Processing document for user: %s", user.id, extra=SAMPLED)
+            with STAGE_SECONDS.time(stage="save_user"):
+                saved_user = await storage_service.save_user(user.id, user.username)
             
-            if not await check_channel_membership(update, context):
+            with STAGE_SECONDS.time(stage="membership"):
+                is_member = await check_channel_membership(update, context)
+            if not is_member:
+                UPLOADS.inc(result="not_member")
                 keyboard = [[InlineKeyboardButton("عضویت در کانال", url="https://t.me/growly_ir")]]
                 reply_markup = InlineKeyboardMarkup(keyboard)
                 await update.message.reply_text(
@@ -61,64 +168,61 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE, st
                 )
                 return
 
+            # Fail fast while Gemini is down, before downloading anything
+            gemini_client = get_gemini_client()
+            gemini_client.ensure_available()
+            premium = await is_premium_user(saved_user)
+
             processing_message = await update.message.reply_text("در حال پردازش رزومه شما. لطفاً چند لحظه صبر کنید...")
 
-            file = await update.message.document.get_file()
-            file_content = await file.download_as_bytearray()
+            with STAGE_SECONDS.time(stage="download"):
+                file = await update.message.document.get_file()
+                file_content = await file.download_as_bytearray()
             mime_type = update.message.document.mime_type
             
-            if mime_type == 'application/pdf':
-                resume_file = BytesIO(file_content)
-            elif mime_type.startswith('image/'):
-                image = Image.open(BytesIO(file_content))
-                pdf_buffer = BytesIO()
-                image.save(pdf_buffer, 'PDF')
-                resume_file = BytesIO(pdf_buffer.getvalue())
-            else:
-                raise ValueError("Unsupported file type. Please upload a PDF or image file.")
-            
-            analysis, job_positions = cv_analyzer.analyze_cv(resume_file)
+            with STAGE_SECONDS.time(stage="conversion"):
+                if mime_type == 'application/pdf':
+                    resume_file = BytesIO(file_content)
+                elif mime_type.startswith('image/'):
+                    resume_file = image_to_pdf(file_content)
+                else:
+                    raise ValueError("Unsupported file type. Please upload a PDF or image file.")
             
-            # Log the model name from cv_analyzer
-            logger.info(f"Model name from cv_analyzer: {cv_analyzer.model.model_name}")
+            with STAGE_SECONDS.time(stage="analysis"):
+                async with get_scheduler().slot(user.id, premium):
+                    raw_analysis = await gemini_client.analyze(resume_file.getvalue())
+            with STAGE_SECONDS.time(stage="format"):
+                job_positions = extract_job_positions(raw_analysis)
+                analysis = format_response(raw_analysis)
             
             cv_data = {
                 "user_id": update.effective_user.id,
                 "username": update.effective_user.username,
                 "file_id": update.message.document.file_id,
-                "analyzed_data": analysis,
-                "model": cv_analyzer.model.model_name,
+                "raw_analysis": raw_analysis,
+                "model": gemini_client.analyzer.model.model_name,
                 "rating": None
             }
             
-            # Log the cv_data before saving
-            logger.info(f"cv_data before saving: {cv_data}")
+            logger.debug("cv_data before saving: %s", redact(cv_data))
             
-            cv_id = await storage_service.save_cv(cv_data)
-            
-            # Increment the user's CV count
-            await storage_service.increment_user_cv_count(user.id)
-            
-            if job_positions:
-                await storage_service.save_cv_job_positions(cv_id, job_positions)
+            with STAGE_SECONDS.time(stage="db_write"):
+                cv_id = await storage_service.save_cv(cv_data)
+                
+                # Increment the user's CV count
+                await storage_service.increment_user_cv_count(user.id)
+                
+                if job_positions:
+                    await storage_service.save_cv_job_positions(cv_id, job_positions)
             
             # Split the analysis into chunks
             chunks = split_message(analysis)
+            rendered_chunks.put(cv_id, (user.id, chunks))
+            cv_owners.put(cv_id, user.id)
+            recent_cvs.pop(user.id)
             
-            try:
-                for chunk in chunks:
-                    await update.message.reply_text(chunk, parse_mode=ParseMode.MARKDOWN_V2)
-            except BadRequest as e:
-                if "can't parse entities" in str(e).lower():
-                    logger.warning(f"Markdown parsing failed. Sending message without formatting: {str(e)}")
-                    for chunk in chunks:
-                        await update.message.reply_text(chunk.replace('*', '').replace('\\', ''))
-                elif "message is too long" in str(e).lower():
-                    logger.warning("Message is too long. Sending a truncated version.")
-                    truncated_analysis = cv_analyzer.truncate_response(analysis)
-                    await update.message.reply_text(truncated_analysis, parse_mode=ParseMode.MARKDOWN_V2)
-                else:
-                    raise
+            with STAGE_SECONDS.time(stage="send"):
+                await send_chunks(update.message, chunks)
 
             # Send rating options
             rating_options = [
@@ -140,21 +244,188 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE, st
                 reply_markup=reply_markup
             )
             
+            UPLOADS.inc(result="ok")
             break  # If successful, break out of the retry loop
+        except CircuitOpenError as e:
+            if requeued < MAX_REQUEUES:
+                UPLOADS.inc(result="requeued")
+                logger.warning("Gemini unavailable, re-queuing upload for user %s in %.0fs", update.effective_user.id, e.retry_after)
+                await update.message.reply_text("سرویس تحلیل در حال حاضر شلوغ است. رزومه شما در صف قرار گرفت و به‌زودی به‌طور خودکار تحلیل می‌شود.")
+                context.application.create_task(requeue_document(update, context, storage_service, e.retry_after, requeued + 1))
+            else:
+                UPLOADS.inc(result="unavailable")
+                await update.message.reply_text("متأسفانه سرویس تحلیل در حال حاضر در دسترس نیست. لطفاً کمی بعد دوباره رزومه خود را ارسال کنید.")
+            return
+        except AnalysisError as e:
+            logger.error("CV analysis failed (%s): %s", e.kind, e)
+            UPLOADS.inc(result="analysis_failed")
+            await update.message.reply_text("متأسفانه، تحلیل رزومه با مشکل مواجه شد. لطفاً دوباره تلاش کنید یا با پشتیبانی تماس بگیرید.")
+            return
         except (RetryAfter, TimedOut, asyncio.TimeoutError) as e:
             if attempt < max_retries - 1:
                 wait_time = 2 ** attempt  # Exponential backoff
-                logger.warning(f"Attempt {attempt + 1} failed. Retrying in {wait_time} seconds...")
+                logger.warning("Attempt %d failed. Retrying in %d seconds...", attempt + 1, wait_time)
                 await asyncio.sleep(wait_time)
             else:
-                logger.error(f"Failed after {max_retries} attempts: {str(e)}")
+                logger.error("Failed after %d attempts: %s", max_retries, e)
+                UPLOADS.inc(result="timeout")
                 await update.message.reply_text("Sorry, there was an error processing your document. Please try again later.")
                 return
         except Exception as e:
-            logger.error(f"Unexpected error: {str(e)}")
+            logger.error("Unexpected error: %s", e, exc_info=True)
+            UPLOADS.inc(result="error")
             await update.message.reply_text("An unexpected error occurred. Please try again later.")
             return
 
+async def send_chunks(message, chunks) -> None:
+    try:
+        for chunk in chunks:
+            await message.reply_text(chunk, parse_mode=ParseMode.MARKDOWN_V2)
+    except BadRequest as e:
+        if "can't parse entities" in str(e).lower():
+            logger.warning("Markdown parsing failed. Sending message without formatting: %s", e)
+            for chunk in chunks:
+                await message.reply_text(chunk.replace('*', '').replace('\\', ''))
+        elif "message is too long" in str(e).lower():
+            # Only possible when a single line is longer than a message; cut it
+            logger.warning("Message is too long. Sending a truncated version.")
+            for chunk in chunks:
+                await message.reply_text(chunk[:MAX_MESSAGE_LENGTH].replace('*', '').replace('\\', ''))
+        else:
+            raise
+
+async def get_rendered_chunks(cv_id, storage_service: StorageService, user_id):
+    """Telegram-ready chunks of a stored analysis owned by ``user_id``, or None.
+
+    Each analysis is formatted at most once per cache lifetime.
+    """
+    cached = rendered_chunks.get(cv_id)
+    if cached is not None:
+        owner_id, chunks = cached
+        return chunks if owner_id == user_id else None
+    cv = await storage_service.get_cv_analysis(cv_id)
+    if cv is None or cv["user_id"] != user_id:
+        return None
+    if cv["raw_analysis"] is not None:
+        chunks = split_message(format_response(cv["raw_analysis"]))
+    else:
+        # Rows saved before raw_analysis existed hold the already-escaped text
+        chunks = split_message(cv["analyzed_data"])
+    rendered_chunks.put(cv_id, (user_id, chunks))
+    return chunks
+
+async def handle_last_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService) -> None:
+    try:
+        cv_id = await storage_service.get_latest_cv_id(update.effective_user.id)
+        if cv_id is None:
+            await update.message.reply_text("هنوز رزومه‌ای از شما تحلیل نشده است. لطفاً رزومه خود را به صورت فایل PDF ارسال کنید.")
+            return
+        chunks = await get_rendered_chunks(cv_id, storage_service, update.effective_user.id)
+        await send_chunks(update.message, chunks)
+    except Exception as e:
+        logger.error("Error sending last analysis: %s", e, exc_info=True)
+        await update.message.reply_text("متأسفانه در حال حاضر مشکلی پیش آمده است. لطفاً بعداً دوباره تلاش کنید.")
+
+async def get_history_page(storage_service: StorageService, user_id, before=None, after=None):
+    """One page of a user's analyses, newest first, and whether older and newer ones exist."""
+    if after is not None:
+        rows = await storage_service.get_user_cv_page(user_id, after=after, limit=HISTORY_PAGE_SIZE + 1)
+        # The extra row is the newest one; it belongs to the next page up
+        return rows[-HISTORY_PAGE_SIZE:], True, len(rows) > HISTORY_PAGE_SIZE
+    if before is None:
+        rows = recent_cvs.get(user_id)
+        if rows is None:
+            rows = await storage_service.get_user_cv_page(user_id, limit=HISTORY_PAGE_SIZE + 1)
+            recent_cvs.put(user_id, rows)
+    else:
+        rows = await storage_service.get_user_cv_page(user_id, before=before, limit=HISTORY_PAGE_SIZE + 1)
+    return rows[:HISTORY_PAGE_SIZE], len(rows) > HISTORY_PAGE_SIZE, before is not None
+
+def history_cursor(row):
+    return f"{row['created_at'].isoformat()}_{row['id']}"
+
+def build_history_keyboard(rows, has_older, has_newer) -> InlineKeyboardMarkup:
+    keyboard = [
+        [InlineKeyboardButton(f"📄 {row['created_at']:%Y-%m-%d %H:%M}", callback_data=f"show_{row['id']}")]
+        for row in rows
+    ]
+    navigation = []
+    if has_newer:
+        navigation.append(InlineKeyboardButton("🔝 جدیدترین", callback_data="hist_first"))
+        # Keyset cursors: the (created_at, id) of the newest and oldest rows on this page
+        navigation.append(InlineKeyboardButton("➡️ جدیدتر", callback_data=f"hist_new_{history_cursor(rows[0])}"))
+    if has_older:
+        navigation.append(InlineKeyboardButton("قدیمی‌تر ⬅️", callback_data=f"hist_{history_cursor(rows[-1])}"))
+    if navigation:
+        keyboard.append(navigation)
+    return InlineKeyboardMarkup(keyboard)
+
+async def handle_history(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService) -> None:
+    try:
+        rows, has_older, has_newer = await get_history_page(storage_service, update.effective_user.id)
+        if not rows:
+            await update.message.reply_text("هنوز رزومه‌ای از شما تحلیل نشده است. لطفاً رزومه خود را به صورت فایل PDF ارسال کنید.")
+            return
+        await update.message.reply_text(
+            "تحلیل‌های قبلی شما:",
+            reply_markup=build_history_keyboard(rows, has_older, has_newer)
+        )
+    except Exception as e:
+        logger.error("Error retrieving history: %s", e, exc_info=True)
+        await update.message.reply_text("متأسفانه در حال حاضر مشکلی پیش آمده است. لطفاً بعداً دوباره تلاش کنید.")
+
+async def handle_history_page(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService) -> None:
+    query = update.callback_query
+    before = after = None
+    if query.data != "hist_first":
+        # "hist_new_<created_at>_<id>" pages towards newer analyses, "hist_<created_at>_<id>" towards older
+        data = query.data[len("hist_"):]
+        newer = data.startswith("new_")
+        if newer:
+            data = data[len("new_"):]
+        try:
+            created_at, cv_id = data.split("_", 1)
+            cursor = (datetime.fromisoformat(created_at), int(cv_id))
+        except ValueError:
+            await query.answer()
+            return
+        if newer:
+            after = cursor
+        else:
+            before = cursor
+
+    try:
+        rows, has_older, has_newer = await get_history_page(storage_service, query.from_user.id, before, after)
+    except Exception as e:
+        logger.error("Error retrieving history page: %s", e, exc_info=True)
+        await query.answer("متأسفانه در حال حاضر مشکلی پیش آمده است. لطفاً بعداً دوباره تلاش کنید.")
+        return
+    await query.answer()
+    if rows:
+        await query.edit_message_reply_markup(
+            reply_markup=build_history_keyboard(rows, has_older, has_newer)
+        )
+
+async def handle_show_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService) -> None:
+    query = update.callback_query
+    try:
+        cv_id = int(query.data.split("_", 1)[1])
+    except ValueError:
+        await query.answer()
+        return
+
+    try:
+        chunks = await get_rendered_chunks(cv_id, storage_service, query.from_user.id)
+    except Exception as e:
+        logger.error("Error retrieving analysis %s: %s", cv_id, e, exc_info=True)
+        await query.answer("متأسفانه در حال حاضر مشکلی پیش آمده است. لطفاً بعداً دوباره تلاش کنید.")
+        return
+    if chunks is None:
+        await query.answer("این تحلیل پیدا نشد.")
+        return
+    await query.answer()
+    await send_chunks(query.message, chunks)
+
 def split_message(text, max_length=MAX_MESSAGE_LENGTH):
     """Split a message into chunks of maximum length."""
     chunks = []
@@ -175,26 +446,39 @@ def split_message(text, max_length=MAX_MESSAGE_LENGTH):
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService) -> None:
     await update.message.reply_text("لطفاً رزومه خود را به صورت فای PDF ارسال کنید.")
 
+async def get_cv_owner(cv_id, storage_service: StorageService):
+    owner_id = cv_owners.get(cv_id)
+    if owner_id is None:
+        owner_id = await storage_service.get_cv_owner(cv_id)
+        if owner_id is not None:
+            cv_owners.put(cv_id, owner_id)
+    return owner_id
+
 async def handle_rating(update: Update, context: ContextTypes.DEFAULT_TYPE, storage_service: StorageService) -> None:
     query = update.callback_query
-    await query.answer()
+    match = RATING_DATA.match(query.data or "")
+    if not match:
+        await query.answer("درخواست نامعتبر است.")
+        return
+    cv_id = int(match.group(1))
+    rating = int(match.group(2))
 
-    cv_id, rating = query.data.split("_")[1:]
-    cv_id = int(cv_id)
-    rating = int(rating)
+    if await get_cv_owner(cv_id, storage_service) != query.from_user.id:
+        logger.warning("User %s tried to rate cv %s they don't own", query.from_user.id, cv_id)
+        await query.answer("شما فقط می‌توانید تحلیل‌های خودتان را ارزیابی کنید.", show_alert=True)
+        return
 
-    await storage_service.update_cv_rating(cv_id, rating)
+    # Saved in the background; the user gets the thank-you toast right away
+    get_rating_writer(storage_service).submit(cv_id, rating)
+    await query.answer(f"ممنون از ارزیابی شما! شما به این تحلیل {rating} ستاره ({RATING_TEXT[rating]}) دادید.")
 
-    rating_text = {
-        5: "عالی",
-        4: "خوب",
-        3: "متوسط",
-        2: "بد",
-        1: "افتضاح"
-    }.get(rating, "نامشخص")
-
-    await query.edit_message_reply_markup(reply_markup=None)
-    await query.message.reply_text(f"ممنون از ارزیابی شما! شما به این تحلیل {rating} ستاره ({rating_text}) دادید.")
+    try:
+        await query.edit_message_reply_markup(reply_markup=None)
+    except BadRequest as e:
+        # Usually a double press: the keyboard is already gone, the rating still counts
+        logger.debug("Could not remove rating keyboard: %s", e)
 
 def register_handlers(application, storage_service: StorageService):
     application.add_handler(CallbackQueryHandler(lambda update, context: handle_rating(update, context, storage_service), pattern=r"^rate_"))
+    application.add_handler(CallbackQueryHandler(lambda update, context: handle_history_page(update, context, storage_service), pattern=r"^hist_"))
+    application.add_handler(CallbackQueryHandler(lambda update, context: handle_show_analysis(update, context, storage_service), pattern=r"^show_"))
@@ -1,4 +1,5 @@
 import asyncio
+import time
 from telegram import Update
 from telegram.ext import ContextTypes
 
@@ -7,10 +8,10 @@ class RateLimiter:
         self.rate = rate
         self.per = per
         self.allowance = rate
-        self.last_check = asyncio.get_event_loop().time()
+        self.last_check = time.monotonic()
 
     async def __call__(self, update: Update, context: ContextTypes.DEFAULT_TYPE, next_handler):
-        current = asyncio.get_event_loop().time()
+        current = time.monotonic()
         time_passed = current - self.last_check
         self.last_check = current
         self.allowance += time_passed * (self.rate / self.per)
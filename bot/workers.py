@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+
+from services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Update fields that carry the sender, in the order Telegram documents them
+USER_FIELDS = (
+    "message", "edited_message", "callback_query", "inline_query",
+    "chosen_inline_result", "shipping_query", "pre_checkout_query",
+    "my_chat_member", "chat_member", "chat_join_request",
+)
+
+
+def shard_key(data):
+    """The user id an update belongs to, so all of a user's updates land on one worker."""
+    for field in USER_FIELDS:
+        obj = data.get(field)
+        if obj:
+            sender = obj.get("from") or obj.get("chat")
+            if sender and "id" in sender:
+                return sender["id"]
+    return data.get("update_id", 0)
+
+
+class WorkerPool:
+    """Fans raw update dicts out to worker processes, sharded by user id."""
+
+    def __init__(self, count, target):
+        self.count = count
+        self.target = target
+        self.queues = []
+        self.processes = []
+        self.restarts = []
+        self.metrics_queue = None
+        # spawn, not fork: the front process may already have a running event loop and open sockets
+        self._ctx = multiprocessing.get_context("spawn")
+
+    def start(self):
+        self.metrics_queue = self._ctx.Queue()
+        for index in range(self.count):
+            self.queues.append(self._ctx.Queue())
+            self.processes.append(self._spawn(index))
+            self.restarts.append(0)
+        logger.info("Started %d worker processes", self.count)
+
+    def _spawn(self, index):
+        process = self._ctx.Process(target=self.target, args=(index, self.queues[index], self.metrics_queue),
+                                    name=f"bot-worker-{index}", daemon=True)
+        process.start()
+        return process
+
+    def restart_dead(self, max_restarts):
+        """Respawn workers that have exited; False once one has died more than ``max_restarts`` times.
+
+        A restarted worker reads the same queue, so updates sharded to it while it was down are kept.
+        """
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            if self.restarts[index] >= max_restarts:
+                logger.error("Worker %s exited with code %s after %d restarts, giving up",
+                             process.name, process.exitcode, self.restarts[index])
+                return False
+            logger.error("Worker %s exited with code %s, restarting", process.name, process.exitcode)
+            self.restarts[index] += 1
+            self.processes[index] = self._spawn(index)
+        return True
+
+    def dispatch(self, data):
+        self.queues[shard_key(data) % self.count].put_nowait(data)
+
+    def queue_size(self, index):
+        try:
+            return self.queues[index].qsize()
+        except NotImplementedError:  # macOS has no sem_getvalue
+            return None
+
+    def collect_metrics(self):
+        """Merge the metric snapshots workers have pushed into this process's registry."""
+        while True:
+            try:
+                index, snapshot = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                return
+            REGISTRY.merge(f"worker-{index}", snapshot)
+
+    def stop(self, timeout=30):
+        for update_queue in self.queues:
+            update_queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning("Worker %s did not stop in %ss, terminating", process.name, timeout)
+                process.terminate()
+        logger.info("Worker processes stopped")
+
+
+class OrderedDispatcher:
+    """Processes updates concurrently across users but strictly in order for each user."""
+
+    def __init__(self, process):
+        self.process = process
+        self._tails = {}
+
+    def submit(self, data):
+        key = shard_key(data)
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._run(key, previous, data))
+        self._tails[key] = task
+        return task
+
+    async def _run(self, key, previous, data):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.process(data)
+        except Exception as e:
+            logger.error("Error processing update %s: %s", data.get("update_id"), e, exc_info=True)
+        finally:
+            if self._tails.get(key) is asyncio.current_task():
+                del self._tails[key]
+
+    async def drain(self):
+        if self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+
+async def push_metrics(index, metrics_queue, interval):
+    """Send this worker's metrics to the front process every ``interval`` seconds, until cancelled."""
+    while True:
+        metrics_queue.put_nowait((index, REGISTRY.snapshot(worker=str(index))))
+        await asyncio.sleep(interval)
+
+
+async def consume(update_queue, process):
+    """Read updates from the front process until the ``None`` sentinel arrives."""
+    # Ctrl-C reaches the whole process group; let the front process decide when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    dispatcher = OrderedDispatcher(process)
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            data = await loop.run_in_executor(None, update_queue.get, True, 1)
+        except queue.Empty:
+            continue
+        if data is None:
+            break
+        dispatcher.submit(data)
+    await dispatcher.drain()
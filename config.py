@@ -2,4 +2,53 @@ import os
 
 CV_ANALYZER_BOT_TOKEN = os.environ.get("CV_ANALYZER_BOT_TOKEN")
 GOOGLE_GENERATIVE_AI_KEY = os.environ.get("GOOGLE_GENERATIVE_AI_KEY")
-DB_URL = os.environ.get("DB_URL")
\ No newline at end of file
+DB_URL = os.environ.get("DB_URL")
+RENDER_EXTERNAL_URL = os.environ.get("RENDER_EXTERNAL_URL")
+
+# "webhook" (production) or "polling" (local development)
+BOT_MODE = os.environ.get("BOT_MODE") or ("webhook" if RENDER_EXTERNAL_URL else "polling")
+# Number of worker processes; 1 handles updates in the front process
+WORKERS = int(os.environ.get("WORKERS", "1"))
+# How often (seconds) workers send their metrics to the front process, which also checks they're alive
+METRICS_PUSH_INTERVAL = float(os.environ.get("METRICS_PUSH_INTERVAL", "5"))
+# Times a crashed worker process is restarted before the whole service shuts down
+WORKER_MAX_RESTARTS = int(os.environ.get("WORKER_MAX_RESTARTS", "3"))
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+# "text" or "json"
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# Per-logger overrides, e.g. "bot.handlers=DEBUG,httpx=WARNING"
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING,telegram=INFO,asyncio=WARNING,aiohttp.access=WARNING")
+# Share of high-frequency (sampled) events that are kept
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.1"))
+LOG_MAX_FIELD_LENGTH = int(os.environ.get("LOG_MAX_FIELD_LENGTH", "200"))
+
+# Adaptive Gemini client: concurrency bounds, latency above which the limit shrinks,
+# and how many consecutive failures open the circuit breaker for how long
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_TARGET_LATENCY = float(os.environ.get("GEMINI_TARGET_LATENCY", "30"))
+GEMINI_FAILURE_THRESHOLD = int(os.environ.get("GEMINI_FAILURE_THRESHOLD", "5"))
+GEMINI_CIRCUIT_RESET = float(os.environ.get("GEMINI_CIRCUIT_RESET", "60"))
+# GEMINI_MAX_CONCURRENCY is the budget for the whole service: with WORKERS > 1 each worker
+# process gets an equal share (at least 1). The limiter, circuit breaker and de-duplication
+# of identical uploads are still per worker: each worker trips its own breaker after
+# GEMINI_FAILURE_THRESHOLD failures, and only identical files sent to the same worker share a call.
+GEMINI_WORKER_CONCURRENCY = max(1, GEMINI_MAX_CONCURRENCY // WORKERS)
+
+# Pre-rendered Telegram chunks kept in memory, by cv id
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", "256"))
+# Users whose first /history page is kept in memory
+HISTORY_CACHE_SIZE = int(os.environ.get("HISTORY_CACHE_SIZE", "1024"))
+# CV owners kept in memory for checking rating presses
+CV_OWNER_CACHE_SIZE = int(os.environ.get("CV_OWNER_CACHE_SIZE", "4096"))
+
+# Analysis slots only premium users may take (per worker process, out of its
+# GEMINI_WORKER_CONCURRENCY share), and how long and for how many payments a
+# premium check is trusted
+ANALYSIS_RESERVED_PREMIUM = int(os.environ.get("ANALYSIS_RESERVED_PREMIUM", "2"))
+PREMIUM_CACHE_TTL = float(os.environ.get("PREMIUM_CACHE_TTL", "300"))
+PREMIUM_CACHE_SIZE = int(os.environ.get("PREMIUM_CACHE_SIZE", "4096"))
+
+# Ratings are written behind: flushed at least this often (seconds), in batches of at most this many
+RATING_FLUSH_INTERVAL = float(os.environ.get("RATING_FLUSH_INTERVAL", "2"))
+RATING_BATCH_SIZE = int(os.environ.get("RATING_BATCH_SIZE", "500"))
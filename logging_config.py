@@ -0,0 +1,109 @@
+import json
+import logging
+import random
+import sys
+from datetime import datetime, timezone
+
+from config import LOG_FORMAT, LOG_LEVEL, LOG_LEVELS, LOG_MAX_FIELD_LENGTH, LOG_SAMPLE_RATE
+
+# Pass as ``extra=SAMPLED`` on high-frequency events so they are kept at LOG_SAMPLE_RATE
+SAMPLED = {"sampled": True}
+
+REDACTED_KEYS = {"analyzed_data", "analysis", "token", "file_content", "raw_analysis"}
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class truncate:
+    """Defers str()/repr() of a value until a record is actually emitted, then cuts it short."""
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit or LOG_MAX_FIELD_LENGTH
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else repr(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}...(+{len(text) - self.limit} chars)"
+
+    __repr__ = __str__
+
+
+class redact(truncate):
+    """Like ``truncate`` for mappings, but replaces sensitive or bulky values with their size."""
+
+    __slots__ = ()
+
+    def __str__(self):
+        if not isinstance(self.value, dict):
+            return super().__str__()
+        safe = {
+            key: f"<{len(value) if hasattr(value, '__len__') else '?'} redacted>" if key in REDACTED_KEYS else value
+            for key, value in self.value.items()
+        }
+        return str(truncate(safe, self.limit))
+
+    __repr__ = __str__
+
+
+class SamplingFilter(logging.Filter):
+    """Drops a share of records marked with ``extra=SAMPLED``; warnings and up always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra`` fields as top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key != "sampled":
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parse_levels(spec):
+    """Parse ``"httpx=WARNING,bot.handlers=DEBUG"`` into ``{logger: level}``."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, levels=LOG_LEVELS, sample_rate=LOG_SAMPLE_RATE, stream=None):
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+    if sample_rate < 1:
+        handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    for name, logger_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(logger_level)
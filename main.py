@@ -2,59 +2,77 @@ import asyncio
 import logging
 import signal
 import os
-from telegram import Update
+from telegram import Bot, Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-from bot.handlers import start, help_command, handle_document, handle_text, register_handlers
+from bot.handlers import start, help_command, handle_document, handle_text, handle_last_analysis, handle_history, register_handlers, flush_ratings
+from bot.workers import WorkerPool, consume, push_metrics
 from services.storage import StorageService
-from config import CV_ANALYZER_BOT_TOKEN, DB_URL
+from services.metrics import REGISTRY, DB_POOL_CONNECTIONS, UPDATE_QUEUE_SIZE, WORKER_QUEUE_SIZE
+from config import CV_ANALYZER_BOT_TOKEN, DB_URL, BOT_MODE, WORKERS, RENDER_EXTERNAL_URL, METRICS_PUSH_INTERVAL, WORKER_MAX_RESTARTS
 from aiohttp import web
+from logging_config import setup_logging
 
-# Set the root logger to DEBUG level
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", 
-    level=logging.DEBUG
-)
+# Levels, format and sampling come from the LOG_* environment variables
+setup_logging()
 
-# Set your application's logger to DEBUG
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
+
+# Use a more specific webhook path
+WEBHOOK_PATH = f"webhook/{CV_ANALYZER_BOT_TOKEN}"
+
+# How long a webhook received during startup waits for the bot to become ready
+STARTUP_WEBHOOK_TIMEOUT = 25
 
 async def handle_webhook(request):
     update = await request.json()
-    await application.process_update(Update.de_json(update, application.bot))
+    ready = request.app["ready"]
+    if not ready.is_set():
+        # The port is bound before startup finishes; hold early updates until handlers can run
+        try:
+            await asyncio.wait_for(ready.wait(), STARTUP_WEBHOOK_TIMEOUT)
+        except asyncio.TimeoutError:
+            # Telegram redelivers on any non-2xx response
+            return web.Response(status=503)
+    await request.app["on_update"](update)
     return web.Response()
 
-async def main() -> None:
-    global application
-    # Check if required environment variables are set
-    if not CV_ANALYZER_BOT_TOKEN:
-        logger.error("CV_ANALYZER_BOT_TOKEN is not set in the environment variables.")
-        return
-    if not DB_URL:
-        logger.error("DB_URL is not set in the environment variables.")
-        return
+async def handle_health(request):
+    return web.Response(text="ok")
 
-    # Create the StorageService
-    storage_service = StorageService(DB_URL)
+async def handle_ready(request):
+    if request.app["ready"].is_set():
+        return web.Response(text="ready")
+    return web.Response(status=503, text="starting")
 
-    # Prepare the PostgreSQL database
-    try:
-        await storage_service.prepare_postgres_database()
-    except Exception as e:
-        logger.error(f"Failed to prepare database: {e}")
-        return
+async def handle_metrics(request):
+    return web.Response(
+        text=REGISTRY.render(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
 
+def register_runtime_gauges(application, storage_service):
+    """Expose pool sizes, read only when /metrics is scraped."""
+    DB_POOL_CONNECTIONS.set_function(lambda: storage_service.db_pool.get_size(), state="total")
+    DB_POOL_CONNECTIONS.set_function(lambda: storage_service.db_pool.get_idle_size(), state="idle")
+
+def build_application(storage_service, token=CV_ANALYZER_BOT_TOKEN, request=None):
+    """``request`` replaces the Bot API HTTP transport; the benchmarks pass a local stub."""
     # Create the Application and pass it your bot's token.
-    application = Application.builder().token(CV_ANALYZER_BOT_TOKEN).build()
+    builder = Application.builder().token(token)
+    if request is not None:
+        builder = builder.request(request)
+    application = builder.build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", lambda update, context: start(update, context, storage_service)))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("last", lambda update, context: handle_last_analysis(update, context, storage_service)))
+    application.add_handler(CommandHandler("history", lambda update, context: handle_history(update, context, storage_service)))
     application.add_handler(MessageHandler(filters.Document.ALL, lambda update, context: handle_document(update, context, storage_service)))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, lambda update, context: handle_text(update, context, storage_service)))
 
     # Add this logging statement
-    application.add_handler(MessageHandler(filters.Document.ALL, lambda update, context: logger.info(f"Received document: {update.message.document.file_name}")))
+    application.add_handler(MessageHandler(filters.Document.ALL, lambda update, context: logger.info("Received document: %s", update.message.document.file_name)))
 
     # Register the rating handler
     register_handlers(application, storage_service)
@@ -65,53 +83,222 @@ async def main() -> None:
             users = await storage_service.get_all_users()
             await update.message.reply_text(f"Total users in database: {len(users)}")
         except Exception as e:
-            logger.error(f"Error in user_count command: {e}", exc_info=True)
+            logger.error("Error in user_count command: %s", e, exc_info=True)
             await update.message.reply_text("An error occurred while retrieving user count.")
 
     application.add_handler(CommandHandler("user_count", user_count))
 
-    # Set up graceful shutdown
-    stop_signal = asyncio.Event()
-    
-    def signal_handler():
-        """Handles shutdown signals"""
-        stop_signal.set()
+    register_runtime_gauges(application, storage_service)
+    return application
 
-    # Get the current event loop
-    loop = asyncio.get_event_loop()
-    for sig in (signal.SIGINT, signal.SIGTERM):
-        loop.add_signal_handler(sig, signal_handler)
+async def start_web_server(on_update=None):
+    """Serve /health, /ready and /metrics, plus the webhook route when ``on_update`` is given.
+
+    Call ``runner.app["ready"].set()`` once updates can be handled.
+    """
+    app = web.Application()
+    app["ready"] = asyncio.Event()
+    if on_update is not None:
+        app["on_update"] = on_update
+        app.router.add_post(f"/{WEBHOOK_PATH}", handle_webhook)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/ready", handle_ready)
+    app.router.add_get("/metrics", handle_metrics)
+
+    port = int(os.environ.get('PORT', 5000))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '0.0.0.0', port)
+    await site.start()
+    logger.info("Server started on port %s", port)
+    return runner
+
+async def poll_updates(bot, on_update):
+    """Long-poll getUpdates and hand each raw update to ``on_update``, until cancelled."""
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+        except Exception as e:
+            logger.warning("getUpdates failed: %s", e)
+            await asyncio.sleep(5)
+            continue
+        for update in updates:
+            offset = update.update_id + 1
+            await on_update(update.to_dict())
+
+async def run_single_process(stop_signal):
+    """Receive and handle updates in this process."""
+    # Create the StorageService
+    storage_service = StorageService(DB_URL)
+    application = build_application(storage_service)
 
+    async def on_update(data):
+        await application.process_update(Update.de_json(data, application.bot))
+
+    # Bind the port first so the platform sees the service up while we connect
+    runner = await start_web_server(on_update if BOT_MODE == "webhook" else None)
     try:
-        await application.initialize()
+        # Prepare the PostgreSQL database and log in to Telegram concurrently
+        try:
+            await asyncio.gather(storage_service.prepare_postgres_database(), application.initialize())
+        except Exception as e:
+            logger.error("Failed to start: %s", e, exc_info=True)
+            return
         await application.start()
-        
-        port = int(os.environ.get('PORT', 5000))
-        
-        # Use a more specific webhook path
-        webhook_path = f"webhook/{CV_ANALYZER_BOT_TOKEN}"
-        webhook_url = f"{os.environ.get('RENDER_EXTERNAL_URL')}/{webhook_path}"
-        await application.bot.set_webhook(webhook_url)
-        
-        # Set up the web application
-        app = web.Application()
-        app.router.add_post(f"/{webhook_path}", handle_webhook)
-        
-        # Start the webhook
-        runner = web.AppRunner(app)
-        await runner.setup()
-        site = web.TCPSite(runner, '0.0.0.0', port)
-        await site.start()
-        
-        logger.info(f"Server started on port {port}")
-        await asyncio.Event().wait()  # Run forever
+
+        if BOT_MODE == "webhook":
+            await application.bot.set_webhook(f"{RENDER_EXTERNAL_URL}/{WEBHOOK_PATH}")
+        else:
+            await application.bot.delete_webhook()
+            await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            # Only the updater feeds update_queue; webhook updates go straight to process_update
+            UPDATE_QUEUE_SIZE.set_function(application.update_queue.qsize)
+            logger.info("Polling for updates")
+
+        runner.app["ready"].set()
+        logger.info("Bot is ready")
+        await stop_signal.wait()
     except Exception as e:
-        logger.error(f"Error occurred: {e}")
+        logger.error("Error occurred: %s", e, exc_info=True)
     finally:
         logger.info("Stopping the bot...")
-        await application.stop()
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+        await flush_ratings()
         await application.shutdown()
         logger.info("Bot stopped gracefully")
 
+async def run_front_process(stop_signal):
+    """Receive updates and fan them out to WORKERS worker processes."""
+    pool = WorkerPool(WORKERS, worker_main)
+
+    async def on_update(data):
+        pool.dispatch(data)
+
+    bot = Bot(CV_ANALYZER_BOT_TOKEN)
+    storage_service = StorageService(DB_URL)
+    metrics_task = None
+    runner = await start_web_server(on_update if BOT_MODE == "webhook" else None)
+    try:
+        # Prepare the PostgreSQL database once, before any worker connects
+        try:
+            await asyncio.gather(storage_service.prepare_postgres_database(), bot.initialize())
+        except Exception as e:
+            logger.error("Failed to start: %s", e, exc_info=True)
+            return
+        finally:
+            if storage_service.db_pool is not None:
+                await storage_service.db_pool.close()
+
+        # Workers initialize in the background; their queues buffer updates meanwhile
+        pool.start()
+        for index in range(WORKERS):
+            WORKER_QUEUE_SIZE.set_function(lambda index=index: pool.queue_size(index), worker=str(index))
+        metrics_task = asyncio.create_task(supervise_workers(pool, runner.app["ready"], stop_signal))
+
+        if BOT_MODE == "webhook":
+            await bot.set_webhook(f"{RENDER_EXTERNAL_URL}/{WEBHOOK_PATH}")
+            runner.app["ready"].set()
+            logger.info("Bot is ready")
+            await stop_signal.wait()
+        else:
+            await bot.delete_webhook()
+            logger.info("Polling for updates")
+            poll_task = asyncio.create_task(poll_updates(bot, on_update))
+            runner.app["ready"].set()
+            logger.info("Bot is ready")
+            await stop_signal.wait()
+            poll_task.cancel()
+    except Exception as e:
+        logger.error("Error occurred: %s", e, exc_info=True)
+    finally:
+        logger.info("Stopping the bot...")
+        if metrics_task is not None:
+            metrics_task.cancel()
+        await runner.cleanup()
+        await bot.shutdown()
+        if pool.processes:
+            await asyncio.get_running_loop().run_in_executor(None, pool.stop)
+        logger.info("Bot stopped gracefully")
+
+async def supervise_workers(pool, ready, stop_signal):
+    """Merge the workers' latest metrics into /metrics and restart crashed workers, until cancelled.
+
+    A worker that keeps crashing takes the service down, so the platform restarts it
+    instead of its users' updates piling up unanswered.
+    """
+    while True:
+        pool.collect_metrics()
+        if not pool.restart_dead(WORKER_MAX_RESTARTS):
+            ready.clear()
+            stop_signal.set()
+            return
+        await asyncio.sleep(METRICS_PUSH_INTERVAL)
+
+async def run_worker(index, update_queue, metrics_queue):
+    storage_service = StorageService(DB_URL)
+    application = build_application(storage_service)
+    await application.initialize()
+    # Stage timers, Gemini and cache metrics are recorded here but served by the front process
+    metrics_task = asyncio.create_task(push_metrics(index, metrics_queue, METRICS_PUSH_INTERVAL))
+
+    async def process(data):
+        await application.process_update(Update.de_json(data, application.bot))
+
+    logger.info("Worker %d ready", index)
+    try:
+        await consume(update_queue, process)
+    finally:
+        metrics_task.cancel()
+        # Don't hold up exit on a snapshot the front process has stopped reading
+        metrics_queue.cancel_join_thread()
+        await flush_ratings()
+        await application.shutdown()
+
+def worker_main(index, update_queue, metrics_queue):
+    """Entry point of a worker process."""
+    try:
+        asyncio.run(run_worker(index, update_queue, metrics_queue))
+    except Exception as e:
+        # The front process notices the exit and restarts the worker
+        logger.critical("Worker %d crashed: %s", index, e, exc_info=True)
+        raise
+
+async def main() -> None:
+    # Check if required environment variables are set
+    if not CV_ANALYZER_BOT_TOKEN:
+        logger.error("CV_ANALYZER_BOT_TOKEN is not set in the environment variables.")
+        return
+    if not DB_URL:
+        logger.error("DB_URL is not set in the environment variables.")
+        return
+    if BOT_MODE not in ("webhook", "polling"):
+        logger.error("BOT_MODE must be 'webhook' or 'polling', got %r.", BOT_MODE)
+        return
+    if BOT_MODE == "webhook" and not RENDER_EXTERNAL_URL:
+        logger.error("RENDER_EXTERNAL_URL must be set in webhook mode.")
+        return
+
+    # Set up graceful shutdown
+    stop_signal = asyncio.Event()
+
+    def signal_handler():
+        """Handles shutdown signals"""
+        stop_signal.set()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, signal_handler)
+
+    logger.info("Starting in %s mode with %d worker(s)", BOT_MODE, WORKERS)
+    if WORKERS > 1:
+        await run_front_process(stop_signal)
+    else:
+        await run_single_process(stop_signal)
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
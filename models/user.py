@@ -1,16 +1,18 @@
 class User:
-    def __init__(self, user_id, username, is_premium=False, cv_count=0):
+    def __init__(self, user_id, username, is_premium=False, cv_count=0, payment_id=None):
         self.user_id = user_id
         self.username = username
         self.is_premium = is_premium
         self.cv_count = cv_count
+        self.payment_id = payment_id
 
     def to_dict(self):
         return {
             "user_id": self.user_id,
             "username": self.username,
             "is_premium": self.is_premium,
-            "cv_count": self.cv_count
+            "cv_count": self.cv_count,
+            "payment_id": self.payment_id
         }
 
     @classmethod
@@ -19,5 +21,6 @@ class User:
             user_id=data["user_id"],
             username=data["username"],
             is_premium=data["is_premium"],
-            cv_count=data["cv_count"]
+            cv_count=data["cv_count"],
+            payment_id=data.get("payment_id")
         )
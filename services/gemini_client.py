@@ -0,0 +1,232 @@
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from config import GEMINI_CIRCUIT_RESET, GEMINI_FAILURE_THRESHOLD, GEMINI_TARGET_LATENCY, GEMINI_WORKER_CONCURRENCY
+from services.metrics import (
+    GEMINI_CIRCUIT_OPEN,
+    GEMINI_COALESCED,
+    GEMINI_CONCURRENCY_LIMIT,
+    GEMINI_INFLIGHT,
+    GEMINI_RETRIES,
+)
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses (as exposed by google.api_core exceptions' ``code``) worth retrying
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Statuses that mean Gemini wants less traffic from us
+OVERLOAD_STATUS = {429, 503}
+
+
+class AnalysisError(Exception):
+    """Gemini could not analyze a CV, after any retries; ``kind`` is ``"retryable"`` or ``"fatal"``."""
+
+    def __init__(self, kind, message):
+        self.kind = kind
+        super().__init__(message)
+
+
+class CircuitOpenError(Exception):
+    """Gemini is failing; calls are rejected until ``retry_after`` seconds have passed."""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"Gemini circuit breaker is open, retry in {retry_after:.0f}s")
+
+
+def _status(exc):
+    code = getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def classify_error(exc):
+    """Return ``"retryable"`` for transient failures and ``"fatal"`` for everything else."""
+    status = _status(exc)
+    if status is not None:
+        return "retryable" if status in RETRYABLE_STATUS else "fatal"
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError, httpx.TransportError)):
+        return "retryable"
+    return "fatal"
+
+
+def is_retryable(exc):
+    return classify_error(exc) == "retryable"
+
+
+def is_overload(exc):
+    return _status(exc) in OVERLOAD_STATUS or isinstance(exc, (TimeoutError, asyncio.TimeoutError))
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: grows by one per window of fast successes, halves on overload."""
+
+    def __init__(self, maximum, target_latency, minimum=1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.limit = float(maximum)
+        self.inflight = 0
+        self._last_decrease = 0.0
+        self._condition = None
+        GEMINI_CONCURRENCY_LIMIT.set(maximum)
+
+    def _get_condition(self):
+        # Created lazily so the limiter can be built outside a running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def slot(self):
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+        started = time.monotonic()
+        overloaded = False
+        try:
+            yield
+        except Exception as e:
+            overloaded = is_overload(e)
+            raise
+        finally:
+            async with condition:
+                self.inflight -= 1
+                self._adjust(started, overloaded)
+                condition.notify_all()
+
+    def _adjust(self, started, overloaded):
+        latency = time.monotonic() - started
+        if overloaded or latency > self.target_latency:
+            # Calls that started before the last cut already saw the old limit; don't punish twice
+            if started < self._last_decrease:
+                return
+            if self.limit <= self.minimum:
+                return
+            self.limit = max(self.minimum, self.limit / 2)
+            self._last_decrease = time.monotonic()
+            logger.warning("Gemini concurrency limit lowered to %d (latency %.1fs, overloaded=%s)",
+                           int(self.limit), latency, overloaded)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        GEMINI_CONCURRENCY_LIMIT.set(int(self.limit))
+
+
+class CircuitBreaker:
+    """Opens after consecutive transient failures, then lets a single probe through after ``reset_timeout``."""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        GEMINI_CIRCUIT_OPEN.set(0)
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def check(self):
+        """Raise CircuitOpenError while the breaker rejects calls, without claiming the probe."""
+        if self.opened_at is None:
+            return
+        remaining = self.retry_after()
+        if remaining > 0 or self._probing:
+            raise CircuitOpenError(remaining or self.reset_timeout)
+
+    def before_call(self):
+        self.check()
+        if self.opened_at is not None:
+            self._probing = True
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("Gemini circuit breaker closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        GEMINI_CIRCUIT_OPEN.set(0)
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._probing = False
+            GEMINI_CIRCUIT_OPEN.set(1)
+            logger.warning("Gemini circuit breaker opened after %d failures", self.failures)
+
+
+class AdaptiveGeminiClient:
+    """Async front for CVAnalyzer that keeps Gemini load in check during quota or latency spikes.
+
+    Identical uploads in flight share one call, concurrency follows an AIMD limit,
+    only transient errors are retried, and a circuit breaker fails fast while
+    Gemini keeps failing.
+    """
+
+    def __init__(self, analyzer, max_concurrency=GEMINI_WORKER_CONCURRENCY, target_latency=GEMINI_TARGET_LATENCY,
+                 failure_threshold=GEMINI_FAILURE_THRESHOLD, reset_timeout=GEMINI_CIRCUIT_RESET, attempts=3):
+        self.analyzer = analyzer
+        self.limiter = AdaptiveLimiter(max_concurrency, target_latency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.attempts = attempts
+        self._inflight = {}
+        GEMINI_INFLIGHT.set_function(lambda: self.limiter.inflight)
+
+    def ensure_available(self):
+        """Fail fast with CircuitOpenError before doing any work for an upload."""
+        self.breaker.check()
+
+    async def analyze(self, pdf_content):
+        """Return the raw analysis text for ``pdf_content``."""
+        key = hashlib.sha256(pdf_content).hexdigest()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._analyze(pdf_content))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            GEMINI_COALESCED.inc()
+        # Shielded so one impatient caller can't cancel the call for everyone sharing it
+        return await asyncio.shield(task)
+
+    async def _analyze(self, pdf_content):
+        try:
+            return await self._analyze_with_retries(pdf_content)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            # Wrapped so callers' own timeout handling can't mistake this for a Telegram hiccup
+            raise AnalysisError(classify_error(e), str(e)) from e
+
+    async def _analyze_with_retries(self, pdf_content):
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.attempts),
+            wait=wait_random_exponential(multiplier=1, min=2, max=20),
+            retry=retry_if_exception(is_retryable),
+            before_sleep=lambda retry_state: GEMINI_RETRIES.inc(),
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                self.breaker.before_call()
+                try:
+                    async with self.limiter.slot():
+                        text = await asyncio.to_thread(self.analyzer.generate_analysis, pdf_content)
+                except Exception as e:
+                    if is_retryable(e):
+                        self.breaker.record_failure()
+                    else:
+                        # Gemini answered (e.g. rejected this PDF), so the service itself is up
+                        self.breaker.record_success()
+                    raise
+                self.breaker.record_success()
+        return text
@@ -0,0 +1,240 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self, remote=()):
+        """Render this metric, followed by sample lines collected from other processes."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        for samples in remote:
+            lines.extend(samples)
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self, extra=()):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}"
+            for key, value in list(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """A gauge that is either set directly or read from a callback at scrape time."""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        self._functions[self._key(labels)] = function
+
+    def _samples(self, extra=()):
+        values = dict(self._values)
+        for key, function in list(self._functions.items()):
+            try:
+                values[key] = function()
+            except Exception:
+                # A broken callback must never take the whole scrape down
+                continue
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}"
+            for key, value in values.items()
+            if value is not None
+        ]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, extra=()):
+        lines = []
+        for key, (counts, total, count) in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, tuple(extra) + (("le", _format_value(float(bound))),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, extra)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        # source -> {metric name: sample lines}, pushed by worker processes
+        self._remote = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self, **labels):
+        """Sample lines of every metric, with ``labels`` added, for another process to ``merge``."""
+        extra = tuple(labels.items())
+        return {name: metric._samples(extra) for name, metric in self._metrics.items()}
+
+    def merge(self, source, snapshot):
+        """Include ``snapshot`` in every render, replacing the previous one from ``source``."""
+        self._remote[source] = snapshot
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        remotes = list(self._remote.values())
+        return "\n".join(
+            metric.render(snapshot.get(name, ()) for snapshot in remotes)
+            for name, metric in self._metrics.items()
+        ) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "cv_stage_seconds", "Time spent in each stage of CV processing.", ["stage"]
+)
+UPLOADS = REGISTRY.counter(
+    "cv_uploads_total", "Documents received, by outcome.", ["result"]
+)
+GEMINI_REQUESTS = REGISTRY.counter(
+    "gemini_requests_total", "Gemini generate_content attempts, by outcome.", ["result"]
+)
+GEMINI_RETRIES = REGISTRY.counter(
+    "gemini_retries_total", "Gemini calls that were retried after a failure."
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    "cache_requests_total", "Cache lookups, by cache and hit/miss.", ["cache", "result"]
+)
+DB_POOL_CONNECTIONS = REGISTRY.gauge(
+    "db_pool_connections", "Database pool connections, by state.", ["state"]
+)
+UPDATE_QUEUE_SIZE = REGISTRY.gauge(
+    "telegram_update_queue_size", "Updates waiting in the application update queue."
+)
+WORKER_QUEUE_SIZE = REGISTRY.gauge(
+    "worker_queue_size", "Updates waiting for each worker process.", ["worker"]
+)
+GEMINI_CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "gemini_concurrency_limit", "Current adaptive limit on concurrent Gemini calls."
+)
+GEMINI_INFLIGHT = REGISTRY.gauge(
+    "gemini_inflight", "Gemini calls currently in progress."
+)
+GEMINI_COALESCED = REGISTRY.counter(
+    "gemini_coalesced_total", "Analyses served by joining an identical in-flight request."
+)
+GEMINI_CIRCUIT_OPEN = REGISTRY.gauge(
+    "gemini_circuit_open", "1 while the Gemini circuit breaker is rejecting calls."
+)
+ANALYSIS_QUEUE_DEPTH = REGISTRY.gauge(
+    "analysis_queue_depth", "Analyses waiting for a slot, by priority lane.", ["lane"]
+)
+ANALYSIS_ACTIVE = REGISTRY.gauge(
+    "analysis_active", "Analyses holding a slot, by priority lane.", ["lane"]
+)
+ANALYSIS_WAIT_SECONDS = REGISTRY.histogram(
+    "analysis_wait_seconds", "Time spent waiting for an analysis slot, by priority lane.", ["lane"]
+)
+RATINGS_PENDING = REGISTRY.gauge(
+    "ratings_pending", "Ratings accepted but not yet written to the database."
+)
+RATINGS_WRITTEN = REGISTRY.counter(
+    "ratings_written_total", "Ratings flushed to the database, by result.", ["result"]
+)
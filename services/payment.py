@@ -11,5 +11,5 @@ class PaymentService:
 
     def verify_payment(self, payment_id):
         # Implement payment verification logic
-        # This is a placeholder implementation
-        return True
+        # Local stand-in until Zibal verification is wired in: accept ids issued by create_payment
+        return isinstance(payment_id, str) and payment_id.startswith("payment_")
@@ -0,0 +1,76 @@
+import asyncio
+import itertools
+import logging
+
+from config import RATING_BATCH_SIZE, RATING_FLUSH_INTERVAL
+from services.metrics import RATINGS_PENDING, RATINGS_WRITTEN, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class RatingWriter:
+    """Write-behind queue for CV ratings.
+
+    ``submit`` only records the rating in memory; a background task writes
+    pending ratings every ``flush_interval`` seconds, or as soon as
+    ``batch_size`` are waiting, with one ``update_cv_ratings`` call per batch.
+    A later press for the same CV replaces an unwritten earlier one. Must be
+    created inside the running event loop.
+    """
+
+    def __init__(self, storage_service, flush_interval=RATING_FLUSH_INTERVAL, batch_size=RATING_BATCH_SIZE):
+        self.storage_service = storage_service
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending = {}
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._closing = False
+        RATINGS_PENDING.set_function(lambda: len(self._pending))
+
+    def submit(self, cv_id, rating):
+        self._pending[cv_id] = rating
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._pending and not self._closing:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write everything pending; ratings from a failed batch stay queued for the next flush."""
+        async with self._lock:
+            while self._pending:
+                batch = dict(itertools.islice(self._pending.items(), self.batch_size))
+                for cv_id in batch:
+                    del self._pending[cv_id]
+                try:
+                    with STAGE_SECONDS.time(stage="rating_flush"):
+                        await self.storage_service.update_cv_ratings(batch)
+                except Exception as e:
+                    logger.error("Failed to save %d ratings: %s", len(batch), e, exc_info=True)
+                    RATINGS_WRITTEN.inc(len(batch), result="error")
+                    for cv_id, rating in batch.items():
+                        # Don't overwrite a newer press that arrived during the write
+                        self._pending.setdefault(cv_id, rating)
+                    return
+                RATINGS_WRITTEN.inc(len(batch), result="ok")
+
+    async def close(self):
+        """Stop the background task and write what is left."""
+        # Woken rather than cancelled, so a batch already being written isn't lost
+        self._closing = True
+        self._full.set()
+        if self._task is not None:
+            await self._task
+        await self.flush()
+        if self._pending:
+            logger.error("Dropping %d unsaved ratings on shutdown", len(self._pending))
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from services.metrics import ANALYSIS_ACTIVE, ANALYSIS_QUEUE_DEPTH, ANALYSIS_WAIT_SECONDS
+
+PREMIUM = "premium"
+FREE = "free"
+
+
+class AnalysisScheduler:
+    """Admits analyses in priority order when capacity is short.
+
+    Premium requests form a FIFO lane that is always served first and may use
+    every slot. Free requests share what is left minus ``reserved_premium``
+    slots, round-robin across users, so one user uploading many CVs cannot
+    starve the rest. ``capacity`` is a callable so the total can follow the
+    Gemini client's adaptive limit.
+    """
+
+    def __init__(self, capacity, reserved_premium):
+        self.capacity = capacity
+        self.reserved_premium = reserved_premium
+        self.active = {PREMIUM: 0, FREE: 0}
+        self._premium = deque()
+        # user id -> deque of waiters; iteration order is the round-robin order
+        self._free = OrderedDict()
+        self._free_waiting = 0
+        ANALYSIS_QUEUE_DEPTH.set_function(lambda: len(self._premium), lane=PREMIUM)
+        ANALYSIS_QUEUE_DEPTH.set_function(lambda: self._free_waiting, lane=FREE)
+        ANALYSIS_ACTIVE.set_function(lambda: self.active[PREMIUM], lane=PREMIUM)
+        ANALYSIS_ACTIVE.set_function(lambda: self.active[FREE], lane=FREE)
+
+    @asynccontextmanager
+    async def slot(self, user_id, premium):
+        lane = PREMIUM if premium else FREE
+        waiter = asyncio.get_running_loop().create_future()
+        if premium:
+            self._premium.append(waiter)
+        else:
+            self._free.setdefault(user_id, deque()).append(waiter)
+            self._free_waiting += 1
+        queued_at = time.monotonic()
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just before the cancellation landed; hand the slot back
+                self._release(lane)
+            else:
+                self._discard(user_id, lane, waiter)
+            raise
+        ANALYSIS_WAIT_SECONDS.observe(time.monotonic() - queued_at, lane=lane)
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def _total_capacity(self):
+        return max(1, int(self.capacity()))
+
+    def _dispatch(self):
+        total = self._total_capacity()
+        # Never reserve every slot: free users always get at least one
+        free_capacity = max(1, total - self.reserved_premium)
+        while self.active[PREMIUM] + self.active[FREE] < total:
+            if self._premium:
+                self._grant(self._premium.popleft(), PREMIUM)
+            elif self._free and self.active[FREE] < free_capacity:
+                user_id, waiters = next(iter(self._free.items()))
+                waiter = waiters.popleft()
+                self._free_waiting -= 1
+                if waiters:
+                    # Served once; go to the back of the rotation
+                    self._free.move_to_end(user_id)
+                else:
+                    del self._free[user_id]
+                self._grant(waiter, FREE)
+            else:
+                break
+
+    def _grant(self, waiter, lane):
+        if waiter.done():  # cancelled while queued
+            return
+        self.active[lane] += 1
+        waiter.set_result(None)
+
+    def _release(self, lane):
+        self.active[lane] -= 1
+        self._dispatch()
+
+    def _discard(self, user_id, lane, waiter):
+        if lane == PREMIUM:
+            if waiter in self._premium:
+                self._premium.remove(waiter)
+            return
+        waiters = self._free.get(user_id)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self._free_waiting -= 1
+            if not waiters:
+                del self._free[user_id]
@@ -1,11 +1,18 @@
-import json
+import zlib
 from datetime import datetime
 import asyncpg
 import logging
 from config import DB_URL
+from logging_config import SAMPLED
+from services.cv_analyzer import format_response
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
+
+def compress_text(text):
+    return zlib.compress(text.encode('utf-8'), 6)
+
+def decompress_text(data):
+    return zlib.decompress(data).decode('utf-8') if data is not None else None
 
 class StorageService:
     def __init__(self, db_url):
@@ -17,7 +24,7 @@ class StorageService:
             try:
                 self.db_pool = await asyncpg.create_pool(self.db_url)
             except Exception as e:
-                logger.error(f"Failed to create database pool: {e}")
+                logger.error("Failed to create database pool: %s", e)
                 raise
         return self.db_pool
 
@@ -34,6 +41,9 @@ class StorageService:
                         last_activity TIMESTAMP
                     );
 
+                    -- Set by hand, together with is_premium, until the payment flow exists
+                    ALTER TABLE users ADD COLUMN IF NOT EXISTS payment_id TEXT;
+
                     CREATE TABLE IF NOT EXISTS cv_data (
                         id SERIAL PRIMARY KEY,
                         user_id BIGINT NOT NULL,
@@ -55,10 +65,34 @@ class StorageService:
                         position_id INTEGER REFERENCES job_positions(position_id),
                         PRIMARY KEY (cv_id, position_id)
                     );
+
+                    -- Raw model output, zlib-compressed. New rows leave analyzed_data NULL:
+                    -- the escaped Telegram text is rebuilt from raw_analysis when needed.
+                    ALTER TABLE cv_data ADD COLUMN IF NOT EXISTS raw_analysis BYTEA;
+                    ALTER TABLE cv_data ALTER COLUMN analyzed_data DROP NOT NULL;
+
+                    -- Covers /history: per-user keyset pagination without touching the heap.
+                    -- rating stays out of it so rating updates remain HOT; the first version
+                    -- of this index included it and is replaced here.
+                    DROP INDEX IF EXISTS cv_data_user_created_idx;
+                    CREATE INDEX IF NOT EXISTS cv_data_user_history_idx
+                        ON cv_data (user_id, created_at DESC, id DESC);
+
+                    -- Number of analyses per rating, kept in step by update_cv_ratings
+                    CREATE TABLE IF NOT EXISTS rating_stats (
+                        rating INTEGER PRIMARY KEY,
+                        count BIGINT NOT NULL DEFAULT 0
+                    );
+
+                    -- Seeded once from existing ratings; afterwards only deltas are applied
+                    INSERT INTO rating_stats (rating, count)
+                    SELECT rating, COUNT(*) FROM cv_data
+                    WHERE rating IS NOT NULL AND NOT EXISTS (SELECT 1 FROM rating_stats)
+                    GROUP BY rating;
                 """)
             logger.info("Database tables created successfully")
         except Exception as e:
-            logger.error(f"Error creating PostgreSQL tables: {e}", exc_info=True)
+            logger.error("Error creating PostgreSQL tables: %s", e, exc_info=True)
             raise
 
     async def save_user(self, user_id, username):
@@ -72,10 +106,10 @@ class StorageService:
                     SET username = $2, last_activity = $3
                     RETURNING *
                 """, user_id, username, datetime.now())
-                logger.info(f"User saved successfully: {dict(result)}")
+                logger.debug("User saved successfully: %s", user_id, extra=SAMPLED)
                 return dict(result)
             except Exception as e:
-                logger.error(f"Error saving user: {e}", exc_info=True)
+                logger.error("Error saving user %s: %s", user_id, e, exc_info=True)
                 raise
 
     async def get_user(self, user_id):
@@ -87,22 +121,24 @@ class StorageService:
             return None
 
     async def save_cv(self, cv_data):
-        logger.info("Attempting to save CV data")
         pool = await self.get_db_pool()
         async with pool.acquire() as conn:
             try:
                 # Remove 'models/' prefix from the model name if it exists
                 model_name = cv_data['model'].replace('models/', '', 1)
+                raw_analysis = cv_data.get('raw_analysis')
                 result = await conn.fetchrow("""
-                    INSERT INTO cv_data (user_id, username, file_id, analyzed_data, model, rating)
-                    VALUES ($1, $2, $3, $4, $5, $6)
+                    INSERT INTO cv_data (user_id, username, file_id, analyzed_data, raw_analysis, model, rating)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7)
                     RETURNING id
-                """, cv_data['user_id'], cv_data['username'], cv_data['file_id'], 
-                    cv_data['analyzed_data'], model_name, cv_data['rating'])
-                logger.info(f"CV saved successfully with id: {result['id']}")
+                """, cv_data['user_id'], cv_data['username'], cv_data['file_id'],
+                    cv_data.get('analyzed_data'),
+                    compress_text(raw_analysis) if raw_analysis is not None else None,
+                    model_name, cv_data['rating'])
+                logger.info("CV saved successfully with id: %s", result['id'], extra=SAMPLED)
                 return result['id']
             except Exception as e:
-                logger.exception(f"Error saving CV: {e}")
+                logger.exception("Error saving CV: %s", e)
                 raise
 
     async def save_cv_job_positions(self, cv_id, job_positions):
@@ -118,13 +154,41 @@ class StorageService:
                     """, cv_id, position_id)
 
     async def update_cv_rating(self, cv_id, rating):
+        await self.update_cv_ratings({cv_id: rating})
+
+    async def update_cv_ratings(self, ratings):
+        """Apply ``{cv_id: rating}`` in one statement and adjust rating_stats by the difference."""
+        cv_ids = list(ratings)
+        values = [ratings[cv_id] for cv_id in cv_ids]
         pool = await self.get_db_pool()
         async with pool.acquire() as conn:
+            # "o" is read from the statement's snapshot, so it holds each row's rating before this UPDATE
             await conn.execute("""
-                UPDATE cv_data
-                SET rating = $1
-                WHERE id = $2
-            """, rating, cv_id)
+                WITH updated AS (
+                    UPDATE cv_data c
+                    SET rating = v.rating
+                    FROM unnest($1::int[], $2::int[]) AS v(id, rating)
+                    JOIN cv_data o ON o.id = v.id
+                    WHERE c.id = v.id AND c.rating IS DISTINCT FROM v.rating
+                    RETURNING c.rating AS new_rating, o.rating AS old_rating
+                ), deltas AS (
+                    SELECT new_rating AS rating, 1 AS delta FROM updated
+                    UNION ALL
+                    SELECT old_rating, -1 FROM updated
+                    WHERE old_rating IS NOT NULL
+                )
+                INSERT INTO rating_stats (rating, count)
+                SELECT rating, SUM(delta) FROM deltas
+                GROUP BY rating
+                ON CONFLICT (rating) DO UPDATE
+                SET count = rating_stats.count + EXCLUDED.count
+            """, cv_ids, values)
+            logger.debug("Saved %d ratings", len(cv_ids), extra=SAMPLED)
+
+    async def get_cv_owner(self, cv_id):
+        pool = await self.get_db_pool()
+        async with pool.acquire() as conn:
+            return await conn.fetchval("SELECT user_id FROM cv_data WHERE id = $1", cv_id)
 
     async def get_cv_data(self, cv_id):
         pool = await self.get_db_pool()
@@ -133,7 +197,71 @@ class StorageService:
                 SELECT * FROM cv_data
                 WHERE id = $1
             """, cv_id)
-            return dict(result) if result else None
+            if not result:
+                return None
+            cv = dict(result)
+            cv['raw_analysis'] = decompress_text(cv['raw_analysis'])
+            return cv
+
+    async def get_cv_analysis(self, cv_id):
+        """Owner and analysis text of a CV: ``raw_analysis`` for new rows, ``analyzed_data`` for old ones."""
+        pool = await self.get_db_pool()
+        async with pool.acquire() as conn:
+            result = await conn.fetchrow("""
+                SELECT user_id, raw_analysis, CASE WHEN raw_analysis IS NULL THEN analyzed_data END AS analyzed_data
+                FROM cv_data
+                WHERE id = $1
+            """, cv_id)
+            if not result:
+                return None
+            return {
+                'user_id': result['user_id'],
+                'raw_analysis': decompress_text(result['raw_analysis']),
+                'analyzed_data': result['analyzed_data']
+            }
+
+    async def get_user_cv_page(self, user_id, before=None, after=None, limit=5):
+        """A user's CVs, newest first.
+
+        With the ``(created_at, id)`` cursor ``before``, the ``limit`` newest CVs older than it;
+        with ``after``, the ``limit`` oldest CVs newer than it.
+        """
+        pool = await self.get_db_pool()
+        async with pool.acquire() as conn:
+            if after is not None:
+                # Walk the index backwards from the cursor, then restore newest-first order
+                results = await conn.fetch("""
+                    SELECT id, created_at FROM cv_data
+                    WHERE user_id = $1 AND (created_at, id) > ($2, $3)
+                    ORDER BY created_at, id
+                    LIMIT $4
+                """, user_id, after[0], after[1], limit)
+                return [dict(row) for row in reversed(results)]
+            if before is None:
+                results = await conn.fetch("""
+                    SELECT id, created_at FROM cv_data
+                    WHERE user_id = $1
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT $2
+                """, user_id, limit)
+            else:
+                results = await conn.fetch("""
+                    SELECT id, created_at FROM cv_data
+                    WHERE user_id = $1 AND (created_at, id) < ($2, $3)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT $4
+                """, user_id, before[0], before[1], limit)
+            return [dict(row) for row in results]
+
+    async def get_latest_cv_id(self, user_id):
+        pool = await self.get_db_pool()
+        async with pool.acquire() as conn:
+            return await conn.fetchval("""
+                SELECT id FROM cv_data
+                WHERE user_id = $1
+                ORDER BY created_at DESC, id DESC
+                LIMIT 1
+            """, user_id)
 
     async def get_cv_job_positions(self, cv_id):
         pool = await self.get_db_pool()
@@ -150,7 +278,10 @@ class StorageService:
         pool = await self.get_db_pool()
         async with pool.acquire() as conn:
             results = await conn.fetch('SELECT * FROM cv_data')
-            return [dict(row) for row in results]
+            cvs = [dict(row) for row in results]
+            for cv in cvs:
+                cv['raw_analysis'] = decompress_text(cv['raw_analysis'])
+            return cvs
 
     async def increment_user_cv_count(self, user_id):
         pool = await self.get_db_pool()
@@ -164,12 +295,12 @@ class StorageService:
     async def get_service_quality_metrics(self):
         pool = await self.get_db_pool()
         async with pool.acquire() as conn:
-            ratings = await conn.fetch('SELECT rating FROM cv_data WHERE rating IS NOT NULL')
-            ratings = [row['rating'] for row in ratings]
+            rows = await conn.fetch('SELECT rating, count FROM rating_stats')
+        counts = {row['rating']: row['count'] for row in rows}
 
-        total_ratings = len(ratings)
-        rating_sum = sum(ratings)
-        rating_distribution = {i: ratings.count(i) for i in range(1, 6)}
+        total_ratings = sum(counts.values())
+        rating_sum = sum(rating * count for rating, count in counts.items())
+        rating_distribution = {i: counts.get(i, 0) for i in range(1, 6)}
 
         if total_ratings > 0:
             average_rating = rating_sum / total_ratings
@@ -198,7 +329,7 @@ class StorageService:
         pool = await self.get_db_pool()
         async with pool.acquire() as conn:
             results = await conn.fetch("""
-                SELECT c.id, c.analyzed_data, COUNT(DISTINCT cvjp.position_id) as match_count
+                SELECT c.id, c.analyzed_data, c.raw_analysis, COUNT(DISTINCT cvjp.position_id) as match_count
                 FROM cv_data c
                 JOIN cv_job_positions cvjp ON c.id = cvjp.cv_id
                 JOIN job_positions jp ON cvjp.position_id = jp.position_id
@@ -207,7 +338,17 @@ class StorageService:
                 ORDER BY match_count DESC
                 LIMIT $2
             """, job_position, limit)
-            return [{'cv_id': row['id'], 'analyzed_data': json.loads(row['analyzed_data']), 'match_count': row['match_count']} for row in results]
+            similar = []
+            for row in results:
+                raw_analysis = decompress_text(row['raw_analysis'])
+                similar.append({
+                    'cv_id': row['id'],
+                    # Always the escaped Telegram text; rows saved before raw_analysis existed have only this
+                    'analyzed_data': format_response(raw_analysis) if raw_analysis is not None else row['analyzed_data'],
+                    'raw_analysis': raw_analysis,
+                    'match_count': row['match_count'],
+                })
+            return similar
 
     async def get_all_users(self):
         pool = await self.get_db_pool()
@@ -215,10 +356,10 @@ class StorageService:
             try:
                 results = await conn.fetch('SELECT * FROM users')
                 users = [dict(row) for row in results]
-                logger.info(f"Retrieved {len(users)} users from the database")
+                logger.info("Retrieved %d users from the database", len(users))
                 return users
             except Exception as e:
-                logger.error(f"Error retrieving users: {e}", exc_info=True)
+                logger.error("Error retrieving users: %s", e, exc_info=True)
                 raise
 
     async def update_all_user_cv_counts(self):
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import bot.handlers as handlers
+
+BASE = datetime(2024, 1, 1)
+
+
+class FakeStorage:
+    """get_user_cv_page over an in-memory list, with the same cursor semantics as the SQL."""
+
+    def __init__(self, count):
+        self.rows = [{"id": i, "created_at": BASE + timedelta(hours=i)} for i in range(1, count + 1)]
+
+    async def get_user_cv_page(self, user_id, before=None, after=None, limit=5):
+        def key(row):
+            return row["created_at"], row["id"]
+        if after is not None:
+            newer = sorted((row for row in self.rows if key(row) > after), key=key)[:limit]
+            return list(reversed(newer))
+        rows = sorted(self.rows, key=key, reverse=True)
+        if before is not None:
+            rows = [row for row in rows if key(row) < before]
+        return rows[:limit]
+
+
+def cursor(row):
+    return row["created_at"], row["id"]
+
+
+def page(storage, **kwargs):
+    handlers.recent_cvs.pop(1)
+    rows, has_older, has_newer = asyncio.run(handlers.get_history_page(storage, 1, **kwargs))
+    return [row["id"] for row in rows], has_older, has_newer
+
+
+def test_history_pages_older_and_back_newer():
+    storage = FakeStorage(12)
+    assert page(storage) == ([12, 11, 10, 9, 8], True, False)
+    assert page(storage, before=cursor(storage.rows[7])) == ([7, 6, 5, 4, 3], True, True)
+    assert page(storage, before=cursor(storage.rows[2])) == ([2, 1], False, True)
+    # Stepping back up from the last page lands on the same pages as on the way down
+    assert page(storage, after=cursor(storage.rows[1])) == ([7, 6, 5, 4, 3], True, True)
+    assert page(storage, after=cursor(storage.rows[6])) == ([12, 11, 10, 9, 8], True, False)
+
+
+def test_history_keyboard_cursors_round_trip():
+    storage = FakeStorage(12)
+    rows = asyncio.run(storage.get_user_cv_page(1, before=cursor(storage.rows[7])))
+    navigation = handlers.build_history_keyboard(rows, True, True).inline_keyboard[-1]
+    assert [button.callback_data for button in navigation] == [
+        "hist_first",
+        "hist_new_2024-01-01T07:00:00_7",
+        "hist_2024-01-01T03:00:00_3",
+    ]
@@ -0,0 +1,23 @@
+from services.metrics import MetricsRegistry
+
+
+def test_worker_snapshots_are_merged_into_render():
+    front = MetricsRegistry()
+    uploads = front.counter("uploads_total", "Uploads.", ["result"])
+    front.histogram("stage_seconds", "Stage time.", ["stage"], buckets=(1.0,))
+    uploads.inc(result="front")
+
+    worker = MetricsRegistry()
+    worker.counter("uploads_total", "Uploads.", ["result"]).inc(result="ok")
+    worker.histogram("stage_seconds", "Stage time.", ["stage"], buckets=(1.0,)).observe(0.5, stage="analysis")
+
+    front.merge("worker-0", worker.snapshot(worker="0"))
+    # A newer snapshot from the same worker replaces the old one
+    front.merge("worker-0", worker.snapshot(worker="0"))
+    lines = front.render().splitlines()
+
+    assert lines.count("# TYPE uploads_total counter") == 1
+    assert 'uploads_total{result="front"} 1' in lines
+    assert lines.count('uploads_total{result="ok",worker="0"} 1') == 1
+    assert 'stage_seconds_bucket{stage="analysis",worker="0",le="1.0"} 1' in lines
+    assert 'stage_seconds_count{stage="analysis",worker="0"} 1' in lines
@@ -0,0 +1,156 @@
+import asyncio
+
+from services.scheduler import FREE, PREMIUM, AnalysisScheduler
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class Job:
+    """Holds a scheduler slot from the moment it is granted until ``finish`` is called."""
+
+    def __init__(self, scheduler, name, user_id, premium, started):
+        self.name = name
+        self._done = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run(scheduler, user_id, premium, started))
+
+    async def _run(self, scheduler, user_id, premium, started):
+        async with scheduler.slot(user_id, premium):
+            started.append(self.name)
+            await self._done.wait()
+
+    async def finish(self):
+        self._done.set()
+        await self.task
+
+
+def run(test):
+    asyncio.run(test())
+
+
+def test_premium_is_served_before_queued_free_requests():
+    async def test():
+        scheduler = AnalysisScheduler(lambda: 1, reserved_premium=0)
+        started = []
+        holder = Job(scheduler, "holder", 1, False, started)
+        await settle()
+        free = Job(scheduler, "free", 2, False, started)
+        premium = Job(scheduler, "premium", 3, True, started)
+        await settle()
+        assert started == ["holder"]
+
+        await holder.finish()
+        await settle()
+        assert started == ["holder", "premium"]
+        await premium.finish()
+        await settle()
+        assert started == ["holder", "premium", "free"]
+        await free.finish()
+    run(test)
+
+
+def test_reserved_slots_are_kept_for_premium():
+    async def test():
+        scheduler = AnalysisScheduler(lambda: 3, reserved_premium=2)
+        started = []
+        free = [Job(scheduler, f"free{i}", i, False, started) for i in range(3)]
+        await settle()
+        assert started == ["free0"]
+        assert scheduler.active == {PREMIUM: 0, FREE: 1}
+
+        premium = [Job(scheduler, f"premium{i}", 10 + i, True, started) for i in range(2)]
+        await settle()
+        assert started == ["free0", "premium0", "premium1"]
+
+        await free[0].finish()
+        await settle()
+        assert started[-1] == "free1"
+        for job in free[1:] + premium:
+            await job.finish()
+    run(test)
+
+
+def test_free_users_are_served_round_robin():
+    async def test():
+        scheduler = AnalysisScheduler(lambda: 1, reserved_premium=0)
+        started = []
+        holder = Job(scheduler, "a1", "a", False, started)
+        await settle()
+        jobs = [Job(scheduler, name, name[0], False, started) for name in ("a2", "a3", "a4", "b1", "c1")]
+        await settle()
+
+        await holder.finish()
+        for job in sorted(jobs, key=lambda job: ["a2", "b1", "c1", "a3", "a4"].index(job.name)):
+            await settle()
+            assert started[-1] == job.name
+            await job.finish()
+        assert started == ["a1", "a2", "b1", "c1", "a3", "a4"]
+    run(test)
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def test():
+        scheduler = AnalysisScheduler(lambda: 1, reserved_premium=0)
+        started = []
+        holder = Job(scheduler, "holder", 1, False, started)
+        await settle()
+        waiting = Job(scheduler, "waiting", 2, False, started)
+        await settle()
+        waiting.task.cancel()
+        await settle()
+        assert scheduler._free_waiting == 0
+
+        await holder.finish()
+        assert scheduler.active == {PREMIUM: 0, FREE: 0}
+        assert started == ["holder"]
+    run(test)
+
+
+def test_slot_granted_during_cancellation_is_handed_back():
+    async def test():
+        scheduler = AnalysisScheduler(lambda: 1, reserved_premium=0)
+        started = []
+        holder = Job(scheduler, "holder", 1, False, started)
+        await settle()
+        cancelled = Job(scheduler, "cancelled", 2, False, started)
+        next_job = Job(scheduler, "next", 3, False, started)
+        await settle()
+
+        # Releasing the holder grants "cancelled" its slot; cancel it before it can resume
+        holder._done.set()
+        while not holder.task.done():
+            await asyncio.sleep(0)
+        cancelled.task.cancel()
+        await settle()
+
+        assert started == ["holder", "next"]
+        assert scheduler.active == {PREMIUM: 0, FREE: 1}
+        await next_job.finish()
+        assert scheduler.active == {PREMIUM: 0, FREE: 0}
+    run(test)
+
+
+def test_capacity_follows_the_callable():
+    async def test():
+        capacity = [2]
+        scheduler = AnalysisScheduler(lambda: capacity[0], reserved_premium=0)
+        started = []
+        first = Job(scheduler, "first", 1, False, started)
+        second = Job(scheduler, "second", 2, False, started)
+        third = Job(scheduler, "third", 3, False, started)
+        await settle()
+        assert started == ["first", "second"]
+
+        # The limiter halved: a released slot is not refilled while still at the new limit
+        capacity[0] = 1
+        await first.finish()
+        await settle()
+        assert started == ["first", "second"]
+
+        await second.finish()
+        await settle()
+        assert started == ["first", "second", "third"]
+        await third.finish()
+    run(test)
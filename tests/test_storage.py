@@ -0,0 +1,104 @@
+"""StorageService against a real Postgres; set TEST_DB_URL to run.
+
+Each test works in a throwaway schema, so the database can be shared.
+"""
+import asyncio
+import os
+import uuid
+
+import asyncpg
+import pytest
+
+from services.rating_writer import RatingWriter
+from services.storage import StorageService
+
+TEST_DB_URL = os.environ.get("TEST_DB_URL")
+
+pytestmark = pytest.mark.skipif(not TEST_DB_URL, reason="TEST_DB_URL is not set")
+
+
+async def make_storage():
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+    conn = await asyncpg.connect(TEST_DB_URL)
+    try:
+        await conn.execute(f"CREATE SCHEMA {schema}")
+    finally:
+        await conn.close()
+    storage = StorageService(TEST_DB_URL)
+    storage.db_pool = await asyncpg.create_pool(TEST_DB_URL, server_settings={"search_path": schema})
+    await storage.prepare_postgres_database()
+    return storage, schema
+
+
+async def drop_storage(storage, schema):
+    await storage.db_pool.close()
+    conn = await asyncpg.connect(TEST_DB_URL)
+    try:
+        await conn.execute(f"DROP SCHEMA {schema} CASCADE")
+    finally:
+        await conn.close()
+
+
+async def insert_cv(storage, user_id=1):
+    async with storage.db_pool.acquire() as conn:
+        return await conn.fetchval(
+            "INSERT INTO cv_data (user_id, file_id, model) VALUES ($1, 'file', 'model') RETURNING id",
+            user_id,
+        )
+
+
+async def rating_stats(storage):
+    async with storage.db_pool.acquire() as conn:
+        rows = await conn.fetch("SELECT rating, count FROM rating_stats WHERE count <> 0")
+    return {row["rating"]: row["count"] for row in rows}
+
+
+def run_with_storage(test):
+    async def runner():
+        storage, schema = await make_storage()
+        try:
+            await test(storage)
+        finally:
+            await drop_storage(storage, schema)
+    asyncio.run(runner())
+
+
+def test_changed_rating_moves_between_buckets():
+    async def test(storage):
+        cv_id = await insert_cv(storage)
+        writer = RatingWriter(storage, flush_interval=60)
+        writer.submit(cv_id, 5)
+        await writer.flush()
+        assert await rating_stats(storage) == {5: 1}
+
+        writer.submit(cv_id, 3)
+        await writer.flush()
+        assert await rating_stats(storage) == {3: 1}
+        await writer.close()
+
+        metrics = await storage.get_service_quality_metrics()
+        assert metrics["total_ratings"] == 1
+        assert metrics["average_rating"] == 3
+    run_with_storage(test)
+
+
+def test_batch_and_repeated_rating():
+    async def test(storage):
+        first = await insert_cv(storage)
+        second = await insert_cv(storage)
+        await storage.update_cv_ratings({first: 4, second: 4})
+        # Same rating again changes nothing
+        await storage.update_cv_ratings({first: 4, second: 2})
+        assert await rating_stats(storage) == {4: 1, 2: 1}
+    run_with_storage(test)
+
+
+def test_rating_stats_seeded_from_existing_ratings():
+    async def test(storage):
+        cv_id = await insert_cv(storage)
+        async with storage.db_pool.acquire() as conn:
+            await conn.execute("UPDATE cv_data SET rating = 5 WHERE id = $1", cv_id)
+            await conn.execute("DELETE FROM rating_stats")
+        await storage.prepare_postgres_database()
+        assert await rating_stats(storage) == {5: 1}
+    run_with_storage(test)